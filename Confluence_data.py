@@ -1,68 +1,89 @@
-from flask import Flask, jsonify,Response
-import requests
+from flask import Flask, jsonify, Response, request, stream_with_context
 from dotenv import load_dotenv
 import os
-from requests.auth import HTTPBasicAuth
 import json
+import time
+import zlib
+from adf_renderer import render_adf
+from confluence_client import ConfluenceError
+import services
 
-def GetSpacePages():
-    CONFLUENCE_USERNAME = os.getenv("CONFLUENCE_USERNAME")
-    CONFLUENCE_API_TOKEN = os.getenv("CONFLUENCE_API_TOKEN")
-    
-    base_url = "https://digitalcareerinstitute.atlassian.net/wiki"
-    endpoint = "/api/v2/spaces/1474564/pages?body-format=atlas_doc_format&status=current&start=0&limit=250"
-    auth = HTTPBasicAuth(CONFLUENCE_USERNAME, CONFLUENCE_API_TOKEN)
-    headers = {"Accept": "application/json"}
+# Seconds after the last sync before the page store is refreshed in the background
+SPACE_PAGES_MAX_AGE = int(os.getenv("SPACE_PAGES_MAX_AGE", 900))
 
-    pages = []
 
-    while True:
-        response = requests.get(base_url + endpoint, headers=headers, auth=auth)
+def GetSpacePages(refresh=None):
+    """
+    All pages of the space as a JSON array, streamed page by page.
+    Served from the page store with an ETag; once it is older than SPACE_PAGES_MAX_AGE refresh() is called
+    to sync it in the background and the stored pages are served meanwhile.
+    Only an empty store is filled from Confluence as the pages arrive
+    """
+    operator = services.get_operator()
+    store = operator.store
 
-        if response.status_code != 200:
-            return jsonify({"error": "Failed to fetch space content", "status_code": response.status_code})
+    if len(store):
+        synced_at = store.synced_at()
+        if refresh is not None and (synced_at is None or time.time() - synced_at >= SPACE_PAGES_MAX_AGE):
+            refresh()
+        # Weak: the same pages are sent gzip compressed or not
+        etag = f"{store.revision}-{store.updated_at()}"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304, headers={'Vary': 'Accept-Encoding'})
+        else:
+            response = _json_array_response(store.iter_pages())
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
 
-        json_data = json.loads(response.text)
+    pages = operator.iter_space_pages()
+    try:
+        # Errors of the first request can still be answered with an error status
+        first = next(pages, None)
+    except ConfluenceError as e:
+        return jsonify({"error": "Failed to fetch space content", "status_code": e.status_code})
 
-        # Extract and append text content from the current page
-        text_content = extract_text_from_json(json_data)
-        pages.append(json_data)
+    def all_pages():
+        if first is not None:
+            yield first
+        yield from pages
 
-        if 'next' in json_data['_links']:
-            endpoint = json_data['_links']['next']
-        else:
-            break
+    return _json_array_response(all_pages())
+
+
+def _json_array_response(items) -> Response:
+    """Stream the items as one JSON array, gzip compressed when the client accepts it"""
+    def chunks():
+        yield "["
+        for idx, item in enumerate(items):
+            yield ("," if idx else "") + json.dumps(item)
+        yield "]"
 
-    # Merge batches of pages in a single array
-    merged_pages = []
-    for batch in pages:
-        merged_pages.extend(batch['results'])
+    body = (chunk.encode('utf-8') for chunk in chunks())
+    headers = {'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body = _gzip(body)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(body), mimetype='application/json', headers=headers)
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
 
-    total_pages = len(merged_pages)
-    print(f"Fetched {total_pages} pages in total.")
-    
-    return jsonify(merged_pages)
 
 def extract_text_from_json(json_data):
     extracted_text = []
 
-    def recursive_extract(element):
-        if isinstance(element, dict):
-            if "type" in element and element["type"] == "text" and "text" in element:
-                extracted_text.append(element["text"])
-            for key, value in element.items():
-                recursive_extract(value)
-        elif isinstance(element, list):
-            for item in element:
-                recursive_extract(item)
-
     # Loop through the "results" array to extract text content
-    if "results" in json_data:
-        for result in json_data["results"]:
-            if "body" in result and "atlas_doc_format" in result["body"]:
-                doc_format = result["body"]["atlas_doc_format"]
-                if "value" in doc_format:
-                    doc_value = json.loads(doc_format["value"])
-                    recursive_extract(doc_value)
+    for result in json_data.get("results", []):
+        doc_format = result.get("body", {}).get("atlas_doc_format", {})
+        if "value" in doc_format:
+            extracted_text.append(render_adf(json.loads(doc_format["value"])))
 
     return " ".join(extracted_text)
@@ -0,0 +1,136 @@
+import json
+import threading
+from collections import OrderedDict
+
+# Bumped whenever the rendered text of an unchanged document changes, so cached texts get re-rendered
+RENDERER_VERSION = 2
+
+# Actions of the render loop
+_NODE, _WRITE, _STRIP, _HEADING = 0, 1, 2, 3
+
+
+def render_adf(document) -> str:
+    """
+    Convert an ADF document to plain text.
+    Iterative (no recursion limit on deeply nested pages), every node writes into the same output buffer
+    """
+    out = []
+    stack = [(_NODE, document, True)]
+
+    while stack:
+        action, value, is_root = stack.pop()
+
+        if action == _WRITE:
+            out.append(value)
+            continue
+
+        if action == _STRIP:
+            _strip_tail(out, value)
+            continue
+
+        if action == _HEADING:
+            # Markdown heading marker, kept out of the buffer until it is known that the heading has text
+            start, level = value
+            _strip_tail(out, start + 1)
+            if any(out[start + 1:]):
+                out[start] = "#" * level + " "
+            continue
+
+        node = value
+        node_type = node.get("type", "")
+        children = node.get("content", [])
+
+        if node_type == "text":
+            out.append(_render_text(node))
+            continue
+
+        # The actions are pushed in reverse, so the children are rendered in document order
+        if node_type == "listItem":
+            # Children joined without separator, followed by a newline
+            stack.append((_WRITE, "\n", False))
+            stack.extend((_NODE, child, False) for child in reversed(children))
+
+        elif node_type == "codeBlock":
+            out.append("```\n")
+            stack.append((_WRITE, "\n```\n", False))
+            stack.extend((_NODE, child, False) for child in reversed(children))
+
+        elif node_type == "heading":
+            out.append("")
+            stack.append((_HEADING, (len(out) - 1, node.get("attrs", {}).get("level", 1)), False))
+            stack.extend((_NODE, child, False) for child in reversed(children))
+
+        elif node_type == "bulletList":
+            # A bullet point before every item, items separated by newlines
+            for idx in range(len(children) - 1, -1, -1):
+                stack.append((_NODE, children[idx], False))
+                stack.append((_WRITE, "- ", False))
+                if idx:
+                    stack.append((_WRITE, "\n", False))
+
+        else:
+            # Block elements of the document are separated by newlines, inline content is not.
+            # The rendered content of the node is stripped
+            stack.append((_STRIP, len(out), False))
+            separator = "\n" if is_root else ""
+            for idx in range(len(children) - 1, -1, -1):
+                stack.append((_NODE, children[idx], False))
+                if idx and separator:
+                    stack.append((_WRITE, separator, False))
+
+    return "".join(out)
+
+
+def _render_text(node) -> str:
+    text = node.get("text", "")
+
+    for mark in node.get("marks", []):
+        mark_type = mark.get("type", "")
+        # Handle some of the marks. Others can be added as needed.
+        if mark_type == "link":
+            url = mark.get("attrs", {}).get("url", "")
+            text = f"{text} <{url}>"
+
+    return text
+
+
+def _strip_tail(out: list, start: int) -> None:
+    """Strip the text written to the buffer since `start`, touching only the fragments at its edges"""
+    for idx in range(start, len(out)):
+        out[idx] = out[idx].lstrip()
+        if out[idx]:
+            break
+
+    for idx in range(len(out) - 1, start - 1, -1):
+        out[idx] = out[idx].rstrip()
+        if out[idx]:
+            break
+
+
+class AdfTextCache:
+    """
+    Memoized render_adf results by (page id, version).
+    The ADF json is only parsed when the page version was not rendered before
+    """
+
+    def __init__(self, maxsize: int = 20000):
+        self.maxsize = maxsize
+        self._texts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, page_id: str, version, adf) -> str:
+        key = (page_id, version)
+        with self._lock:
+            if key in self._texts:
+                self._texts.move_to_end(key)
+                return self._texts[key]
+
+        document = json.loads(adf) if isinstance(adf, str) else adf
+        text = render_adf(document)
+
+        with self._lock:
+            self._texts[key] = text
+            if len(self._texts) > self.maxsize:
+                self._texts.popitem(last=False)
+
+        return text
@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class AnswerCache:
+    """
+    Cache of the answers given by ask_question.
+    Two layers: exact match on the normalized question and near duplicates by query embedding similarity.
+    Entries are evicted LRU and after a TTL, and dropped when one of the articles they were built from changes
+    """
+
+    def __init__(self, maxsize: int = None, ttl: float = None, similarity: float = None):
+        self.maxsize = maxsize or int(os.getenv("ANSWER_CACHE_SIZE", 512))
+        self.ttl = ttl or float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+        self.similarity = similarity or float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.97))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'invalidated': 0}
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+    def _alive(self, key, entry) -> bool:
+        if entry['expires'] > time.monotonic():
+            return True
+        del self._entries[key]
+        return False
+
+    def get(self, question: str):
+        """Answer cached for the same normalized question, None on a miss"""
+        key = self.normalize(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._alive(key, entry):
+                self._entries.move_to_end(key)
+                self.counters['exact_hits'] += 1
+                return entry['answer']
+        return None
+
+    def get_similar(self, vector):
+        """
+        Answer cached for the most similar question above the similarity threshold, None on a miss.
+        Called after get() missed, so this is where misses are counted (vector is None without embeddings)
+        """
+        with self._lock:
+            if vector is None:
+                self.counters['misses'] += 1
+                return None
+
+            query = self._unit(vector)
+            candidates = [
+                (key, entry) for key, entry in list(self._entries.items())
+                if entry['vector'] is not None and self._alive(key, entry)
+            ]
+            if candidates:
+                scores = np.stack([entry['vector'] for _, entry in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.counters['similar_hits'] += 1
+                    return entry['answer']
+
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, question: str, answer: str, article_ids, vector=None) -> None:
+        entry = {
+            'answer': answer,
+            'article_ids': set(article_ids),
+            'vector': self._unit(vector) if vector is not None else None,
+            'expires': time.monotonic() + self.ttl,
+        }
+        key = self.normalize(question)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_articles(self, article_ids) -> None:
+        """Drop the answers that were built from any of the given articles"""
+        article_ids = set(article_ids)
+        with self._lock:
+            outdated = [key for key, entry in self._entries.items() if entry['article_ids'] & article_ids]
+            for key in outdated:
+                del self._entries[key]
+            self.counters['invalidated'] += len(outdated)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters['invalidated'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, 'size': len(self._entries)}
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -1,8 +1,12 @@
+import services
 from icecream import ic
 from articles_operator import ArticlesOperator
-from dotenv import load_dotenv
+from sync_scheduler import SyncAlreadyRunning, SyncScheduler
+from metrics import metrics
 import os
-from flask import Flask, jsonify, Response, request 
+import hmac
+import json
+from flask import Flask, jsonify, Response, request, stream_with_context
 import requests
 from Confluence_data import GetSpacePages, extract_text_from_json
 import sentry_sdk
@@ -15,12 +19,18 @@ import time
 # Add this decorator to instrument your python function
 
 sentry_sdk.init(
-    dsn="https://bd9804963261404b14353239ecf78bda@o1264169.ingest.sentry.io/4506064744349696",
-    traces_sample_rate=1.0,
+    dsn=os.getenv("SENTRY_DSN", "https://bd9804963261404b14353239ecf78bda@o1264169.ingest.sentry.io/4506064744349696"),
+    # Share of the requests that are traced; the stage timings of every request are in /metrics
+    traces_sample_rate=float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", 0.05)),
 )
 
 
 application = Flask(__name__)
+services.warm_up_in_background()
+
+sync_scheduler = SyncScheduler()
+if os.getenv("SYNC_SCHEDULE_ENABLED", "1") == "1":
+    sync_scheduler.start()
 
 
 MOODLE_API_TOKEN = os.getenv("MOODLE_TOKEN")
@@ -29,24 +39,82 @@ MOODLE_API_TOKEN = os.getenv("MOODLE_TOKEN")
 
 @application.route("/")
 def hello_world():
+    # Load balancer health checks land here, a sync is started with POST /sync
+    return "<p>Hello, World!</p>"
+
+@application.route("/sync", methods=["POST"])
+def trigger_sync():
     try:
-        get_space_pages()
-        loader = ArticlesOperator()
-        loader.load_pages()
-        loader.upload()
-   
-        # Raises an error
-        return "<p>Passed !</p>"
-    except Exception as e:
-        sentry_sdk.capture_exception(e)
-        return "<p>Error occurred. The error has been reported to Sentry.</p>"
-    
+        return jsonify({"job_id": sync_scheduler.trigger()}), 202
+    except SyncAlreadyRunning as e:
+        return jsonify({"error": "A sync is already running", "job_id": e.args[0]}), 409
+
+@application.route("/sync/status")
+def sync_status():
+    return jsonify(sync_scheduler.status())
+
 @application.route("/confluence/space/AllSpacePages")
 def get_space_pages():
-    return GetSpacePages()
+    return GetSpacePages(refresh=refresh_in_background)
+
+def refresh_in_background():
+    try:
+        sync_scheduler.trigger()
+    except SyncAlreadyRunning:
+        pass
+
+@application.route("/ask/stream", methods=["GET", "POST"])
+def ask_stream():
+    """Answer of the question as server-sent events, one event per generated piece of text"""
+    if not is_authorized(request):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    question = request.args.get("question") or (request.get_json(silent=True) or {}).get("question")
+    if not question:
+        return jsonify({"error": "Missing question"}), 400
+
+    operator = services.get_operator()
+
+    def events():
+        try:
+            for delta in operator.ask_question_stream(question):
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            yield "event: error\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def is_authorized(req) -> bool:
+    """The request carries the shared token as Authorization: Bearer <MOODLE_TOKEN>; no token configured, no access"""
+    scheme, _, token = req.headers.get("Authorization", "").partition(" ")
+    return bool(MOODLE_API_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), MOODLE_API_TOKEN.encode())
+
+@application.route("/answers/cache/stats")
+def answer_cache_stats():
+    return jsonify(ArticlesOperator.answer_cache.stats())
+
+@application.route("/answers/gate/stats")
+def confidence_gate_stats():
+    return jsonify(ArticlesOperator.confidence_gate.stats())
+
+@application.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@application.route("/ready")
+def ready():
+    if services.is_ready():
+        return jsonify({"ready": True})
+    return jsonify({"ready": False}), 503
 
 if __name__ == "__main__":
-    loader = ArticlesOperator()
+    loader = services.get_operator()
     loader.load_pages()
     loader.upload()
    
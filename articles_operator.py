@@ -1,21 +1,56 @@
 import requests
-from langdetect import detect
 import openai
 from dotenv import load_dotenv
 import time
 import os
 import json
+import hashlib
 from icecream import ic
 from weaviate.util import generate_uuid5
-from requests.auth import HTTPBasicAuth
 
+from adf_renderer import AdfTextCache
+from answer_cache import AnswerCache
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from chunking import chunk_page
+from confidence_gate import ConfidenceGate
+from confluence_client import ConfluenceClient
+from context_assembler import ContextAssembler, count_tokens
+from embeddings import AzureEmbeddings, EmbeddingStage
+from language_detection import LanguageDetector
+from llm_client import AzureChatClient, DeploymentUnavailable
+from local_index import LocalVectorIndex
+from metrics import TOKEN_BUCKETS, metrics
+from model_router import ModelRouter
+from page_store import PageStore
 from weaviate_facade import WeaviateFacade
+from schema import article_class, passage_class
+from single_flight import SingleFlight
 import matplotlib.pyplot as plt
 
 
 class ArticlesOperator:
-    save_location = 'pages.json'
-    BASE_URL = "https://digitalcareerinstitute.atlassian.net/wiki"
+    save_location = PageStore.LOCATION
+    SCAN_PAGE_SIZE = int(os.getenv("WEAVIATE_SCAN_PAGE_SIZE", 500))
+    INCREMENTAL_SYNC = os.getenv("CONFLUENCE_INCREMENTAL_SYNC", "1") == "1"
+    # Above this share of changed pages a single listing with bodies is cheaper than fetching by id
+    FULL_DOWNLOAD_RATIO = 0.5
+    # Shared by all operators, so a page version is converted to text only once per process
+    _adf_cache = AdfTextCache()
+    answer_cache = AnswerCache()
+    # Generation of the article changes in the page store that the answer cache is in line with
+    _answer_cache_generation = None
+    confidence_gate = ConfidenceGate()
+    in_flight = SingleFlight()
+    RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "weaviate")
+    # 'vector', or 'hybrid' to fuse the vector results with BM25 keyword results by reciprocal rank
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+    # Candidates taken from each ranking per passage that is returned
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 3))
+    _keyword_index = BM25Index()
+    # updated_at() of the page store when the keyword index was last synced from it
+    _keyword_index_updated_at = None
+    # One pooled, rate limited connection to Azure OpenAI for the whole process
+    _llm = AzureChatClient()
 
     PROMPT = """
 Your task is to answer user's question only based on the provided documentation.
@@ -61,36 +96,43 @@ Documentation: {documentation}
 """
 
 
-    def __init__(self, use_cache=True, pages: list = None, recreate_schema=False):
+    def __init__(self, use_cache=True, pages: list = None, recreate_schema=False, client: WeaviateFacade = None):
         load_dotenv()
         self.pages = pages
         self.CONFLUENCE_USERNAME = os.getenv("CONFLUENCE_USERNAME")
         self.CONFLUENCE_API_TOKEN = os.getenv("CONFLUENCE_API_TOKEN")
         self.DEPLOYMENT_ID = os.getenv("GPT4_DEPLOYMENT_ID")
-        self._client = WeaviateFacade(recreate_schema)
+        self._client = client or WeaviateFacade.instance(recreate_schema)
+        # Called with (phase, counters) as a sync advances
+        self.on_progress = None
+        self._confluence = ConfluenceClient(self.CONFLUENCE_USERNAME, self.CONFLUENCE_API_TOKEN)
+        self._store = PageStore(self.save_location)
+        self._language_detector = LanguageDetector()
+        self._embeddings = AzureEmbeddings()
+        self._embedding_stage = EmbeddingStage(self._embeddings)
+        self._local_index = LocalVectorIndex()
+        self._context_assembler = ContextAssembler()
+        self._router = ModelRouter(strong_deployment=self.DEPLOYMENT_ID)
 
     def load_pages(self, use_cache=False, verbose=False) -> None:
 
         if use_cache:
-            try:
-                os.makedirs(os.path.dirname(self.save_location), exist_ok=True)
-                with open(self.save_location, 'r') as file:
-                    self.pages = json.load(file)
+            self.pages = self._stored_pages()
+            if self.pages is not None:
                 ic('Loaded pages from cache')
+                self._index_keywords(self.pages)
                 return
-            except FileNotFoundError:
-                ic('Cache file not found, downloading pages')
+            ic('Page store is empty, downloading pages')
 
         ic('Downloading pages')
-        self._download_pages()
+        self._report('download')
+        with metrics.span('download'):
+            self._download_pages(cache=False)
+        self._report('language_detection', pages=len(self.pages))
 
-        for page in self.pages:
-            try:
-                page['language'] = detect(page['text'])
-            except:
-                ic('Language detection failed for a page')
-                ic(page)
-                page['language'] = 'unknown'
+        # Pages reused from the cache by the incremental download already have their language
+        with metrics.span('language_detection'):
+            self._language_detector.detect_pages([page for page in self.pages if 'language' not in page])
 
         if verbose:
             en_count = sum(1 for page in self.pages if page['language'] == 'en')
@@ -101,39 +143,215 @@ Documentation: {documentation}
 
         ic('Language detection completed for all pages')
         self._save_pages_to_cache()
+        self._index_keywords(self.pages)
+
+    @property
+    def store(self) -> PageStore:
+        """Page store shared by the sync and the space pages route"""
+        return self._store
+
+    def _stored_pages(self):
+        """All stored pages, None if nothing is stored yet. Pages stored without their language get it detected"""
+        pages = self._store.pages()
+        missing = [page for page in pages or [] if 'language' not in page]
+        if missing:
+            self._language_detector.detect_pages(missing)
+        return pages
+
+    def _report(self, phase: str, **counters) -> None:
+        if self.on_progress is not None:
+            self.on_progress(phase, counters)
 
     def _save_pages_to_cache(self):
-        os.makedirs(os.path.dirname(self.save_location), exist_ok=True)
-        with open(self.save_location, 'w') as file:
-            json.dump(self.pages, file)
-        ic('Saved pages to cache')
-
-    def query(self, query: str, limit=5) -> dict:
-        return self._client.query.get("Article", ["title", "text", "article_id"]) \
-            .with_near_text({"concepts": query}) \
-            .with_limit(limit) \
-            .do()
-
-    def _get_all_articles(self):
-        data = self._client.query.get("Article", ["last_edited"]).do()
-        data = data['data']['Get']['Article']
-        ic(f'Total of {len(data)} articles')
-        return data
+        with metrics.span('page_store_write'):
+            counts = self._store.replace(self.pages)
+        ic(f"Saved pages to the page store: {counts['written']} written, {counts['deleted']} deleted")
+
+    def _index_keywords(self, pages: list, store_updated_at=None) -> None:
+        """Bring the keyword index in line with the pages, only new and changed articles are re-indexed"""
+        started = time.perf_counter()
+        ArticlesOperator._keyword_index_updated_at = store_updated_at or self._store.updated_at()
+        with metrics.span('keyword_index'):
+            counts = self._keyword_index.sync_pages(pages, chunk_page)
+        ic(f"Keyword index: {counts['indexed']} articles indexed, {counts['removed']} removed in {time.perf_counter() - started:.2f}s")
+
+    def query(self, query: str, limit=5, vector=None) -> dict:
+        """
+        Top passages for the query. In hybrid RETRIEVAL_MODE the vector search and the BM25 keyword search
+        each propose candidates, which are fused by reciprocal rank
+        """
+        if self.RETRIEVAL_MODE != 'hybrid':
+            return self._vector_query(query, limit, vector)
+
+        # Workers that did not run the sync pick up its changes from the page store
+        store_updated_at = self._store.updated_at()
+        if store_updated_at != self._keyword_index_updated_at:
+            self._index_keywords(self._stored_pages() or [], store_updated_at)
+
+        candidates = limit * self.HYBRID_CANDIDATES
+        rankings = [
+            self._vector_query(query, candidates, vector)['data']['Get']['Passage'],
+            self._keyword_index.search(query, candidates),
+        ]
+        return {'data': {'Get': {'Passage': reciprocal_rank_fusion(rankings, limit)}}}
+
+    def _vector_query(self, query: str, limit=5, vector=None) -> dict:
+        """
+        Top passages for the query, searched by the query embedding when it is already known.
+        RETRIEVAL_BACKEND selects Weaviate ('weaviate'), the in-process index ('local'),
+        or Weaviate with the in-process index as fallback when Weaviate fails ('fallback')
+        """
+        if self.RETRIEVAL_BACKEND == 'local' and self._local_index.ready:
+            vector = vector if vector is not None else self._embed_query(query)
+            if vector is not None:
+                return self._local_index.search(vector, limit)
+
+        try:
+            return self._client.search_passages(query, limit, vector)
+        except Exception as e:
+            if self.RETRIEVAL_BACKEND != 'fallback' or not self._local_index.ready:
+                raise
+            vector = vector if vector is not None else self._embed_query(query)
+            if vector is None:
+                raise
+            ic(f'Weaviate search failed, using the local index: {e!r}')
+            return self._local_index.search(vector, limit)
+
+    def _get_all_articles(self, properties=("article_id", "content_hash"), page_size=None):
+        """Lazily iterate over all Article objects, page by page"""
+        total = 0
+        for batch in self._client.iter_objects("Article", list(properties), page_size or self.SCAN_PAGE_SIZE):
+            total += len(batch)
+            yield from batch
+        ic(f'Total of {total} articles')
+
+    @staticmethod
+    def chunk_pages(pages: list) -> list:
+        """Chunking stage between load_pages and upload: the passages of the given pages"""
+        return [passage for page in pages for passage in chunk_page(page)]
+
+    def _sync_passages(self, uploaded_pages: list, outdated_ids: list, unchanged_pages: list) -> None:
+        """
+        Replace the passages of the uploaded pages and drop the ones of outdated articles.
+        Unchanged articles that have no passages yet (e.g. indexed before chunking existed) get them too
+        """
+        indexed = {
+            passage['article_id']
+            for batch in self._client.iter_objects("Passage", ["article_id"], self.SCAN_PAGE_SIZE)
+            for passage in batch
+        }
+        pages = uploaded_pages + [page for page in unchanged_pages if page['article_id'] not in indexed]
+
+        # Old passages go first, a changed page may be split into fewer passages than before
+        self._client.delete_where("Passage", "article_id", outdated_ids)
+
+        passages = self.chunk_pages(pages)
+        self._report('passages', passages=len(passages))
+        vectors = self._embed_records(passages)
+        with metrics.span('import', data_type='Passage'):
+            self._client.upload_data(passages, 'Passage', vectors)
+        ic(f'Total of {len(passages)} passages of {len(pages)} articles were uploaded')
+
+    def _refresh_local_index(self, pages: list) -> None:
+        """Rebuild the in-process index from all current pages; unchanged passages come from the vector cache"""
+        passages = self.chunk_pages(pages)
+        vectors = self._embed_records(passages)
+        if vectors is None:
+            ic('Local index was not refreshed, the passages could not be embedded')
+            return
+        self._local_index.build(passages, vectors)
+
+    @staticmethod
+    def _content_hash(page) -> str:
+        """Fingerprint of everything that is stored for a page, so any change triggers a re-upload"""
+        _, article = WeaviateFacade.mapper('Article', {**page, 'content_hash': ''})
+        article.pop('content_hash')
+        return hashlib.sha1(json.dumps(article, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _build_remote_index(self) -> dict:
+        """Index of the articles in Weaviate: {article_id: {'uuids': [...], 'content_hash': ...}}"""
+        index = {}
+        for article in self._get_all_articles():
+            entry = index.setdefault(article.get('article_id'), {'uuids': [], 'content_hash': None})
+            entry['uuids'].append(article['_additional']['id'])
+            entry['content_hash'] = entry['content_hash'] or article.get('content_hash')
+        return index
 
     def ask_question(self, query: str, limit=5, verbose=False) -> str:
         """
         Use search query to answer questions about articles. 
         """
+        prepared = self._prepare_question(query, limit, verbose)
+        if isinstance(prepared, str):
+            return prepared
+        data, key, article_ids, vector, deployments = prepared
+
+        # Identical questions over the same passages that are asked at the same time share one completion
+        with metrics.span('llm_wait'):
+            answer = self.in_flight.do(key, lambda: self._complete(data, deployments))
+
+        self.answer_cache.put(query, answer, article_ids, vector)
+        return answer
+
+    def ask_question_stream(self, query: str, limit=5, verbose=False):
+        """
+        Same as ask_question, but yields the answer in pieces as the completion is generated.
+        Cached answers are yielded at once
+        """
+        prepared = self._prepare_question(query, limit, verbose)
+        if isinstance(prepared, str):
+            yield prepared
+            return
+        data, key, article_ids, vector, deployments = prepared
+
+        # Identical questions asked while the answer is generated share it, the pieces so far are yielded at once
+        answer = ""
+        with metrics.span('llm_stream'):
+            for delta in self.in_flight.stream(key, lambda: self._stream_complete(data, deployments)):
+                answer += delta
+                yield delta
+
+        self.answer_cache.put(query, answer, article_ids, vector)
+
+    def _prepare_question(self, query: str, limit: int, verbose: bool):
+        """
+        Cached or templated answer of the question, or the completion request for it:
+        (request data, single flight key, ids of the articles in the prompt, question embedding, deployments to try)
+        """
+        self._sync_answer_cache()
+        answer = self.answer_cache.get(query)
+        if answer is not None:
+            metrics.inc('answers_total', source='cache')
+            return answer
+
+        # Greetings and the like get a templated reply without any retrieval or completion
+        fallback = self.confidence_gate.check_question(query)
+        if fallback is not None:
+            metrics.inc('answers_total', source='gate')
+            return fallback
+
+        with metrics.span('embed_query'):
+            vector = self._embed_query(query)
+        answer = self.answer_cache.get_similar(vector)
+        if answer is not None:
+            metrics.inc('answers_total', source='similar_cache')
+            return answer
+
         # Get the documentation from search_articles
-        documentation = self.query(query, limit)
-        pages = documentation['data']['Get']['Article']
+        with metrics.span('retrieval'):
+            documentation = self.query(query, limit, vector)
+        pages = documentation['data']['Get']['Passage']
+
+        # Out of scope questions are pointed to the service desk without a completion
+        fallback = self.confidence_gate.check_passages(pages)
+        if fallback is not None:
+            metrics.inc('answers_total', source='gate')
+            return fallback
 
-        # Get all the pages text and article id
-        pages_text = ""
-        for i, page in enumerate(reversed(pages)):
-            page_text = page.get("text", "").replace("`", "")
-            article_id = page.get("article_id", "")
-            pages_text += f"Document {i+1}: (link: https://digitalcareerinstitute.atlassian.net/servicedesk/customer/portal/1/article/{article_id})\n```Text: {page_text}```\n\n"
+        # Fit the best passages with their article links into the token budget of the prompt
+        with metrics.span('prompt_build'):
+            pages_text, article_ids = self._context_assembler.assemble(pages)
+        metrics.inc('answers_total', source='llm')
 
         if verbose:
             ic(pages_text)
@@ -142,144 +360,259 @@ Documentation: {documentation}
         data = {
             "messages": [
                 {"role": "system",
-                 "content": f"{self.PROMPT.format(documentation=documentation)}"},
+                 "content": f"{self.PROMPT.format(documentation=pages_text)}"},
                 {"role": "user", "content": query}
             ]
         }
 
+        key = (self.answer_cache.normalize(query), tuple((page.get("article_id"), page.get("position")) for page in pages))
+        deployments = self._router.route(query, ConfidenceGate.top_certainty(pages))
+        return data, key, article_ids, vector, deployments
 
-        url = f"{os.getenv('AZURE_OPENAI_BASE')}/openai/deployments/{self.DEPLOYMENT_ID}/chat/completions?api-version=2023-05-15"
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": os.getenv('AZURE_OPENAI_KEY')
-        }
-        # Send the request to OpenAI
-
-        retries = 0
-        while retries < 3:
-            response = requests.post(url, headers=headers, json=data)
-            if response.json().get('error', {}).get('code') == 'InternalServerError':
-                ic(response.json())
-                time.sleep(3)
-                retries += 1
-                ic("Failed to get an answer. Retrying...")
-            else:
-                if retries > 0:
-                    ic("Retry successful!")
-                break
+    def _sync_answer_cache(self) -> None:
+        """
+        Drop the cached answers built from articles that changed since the last check.
+        The sync publishes its changes in the page store, so the answers of every worker process are dropped
+        """
+        generation, article_ids = self._store.changes_since(self._answer_cache_generation)
+        if generation == self._answer_cache_generation:
+            return
+        if article_ids is None:
+            self.answer_cache.clear()
+        elif article_ids:
+            self.answer_cache.invalidate_articles(article_ids)
+        ArticlesOperator._answer_cache_generation = generation
+
+    def _failover(self, deployments: list, idx: int, error: Exception) -> None:
+        """Record the failure of deployments[idx] and raise the error when there is no deployment left"""
+        self._router.record_failure(
+            deployments[idx], isinstance(error, DeploymentUnavailable) and error.status == 429
+        )
+        if idx == len(deployments) - 1:
+            raise error
+        ic(f'{deployments[idx]} failed ({error!r}), failing over to {deployments[idx + 1]}')
+
+    def _complete(self, data: dict, deployments: list) -> str:
+        """
+        Chat completion of the prepared request by the first deployment that answers.
+        Deployments with another one behind them are not retried, the next one is tried instead
+        """
+        for idx, deployment in enumerate(deployments):
+            started = time.perf_counter()
+            try:
+                response = self._llm.complete(deployment, data, None if idx == len(deployments) - 1 else 0)
+            except Exception as e:
+                self._failover(deployments, idx, e)
+                continue
+            self._router.record_success(deployment, time.perf_counter() - started)
+            break
 
         try:
-            answer = response.json()['choices'][0]['message']['content']
+            answer = response['choices'][0]['message']['content']
         except KeyError:
-            ic(response.json())
+            ic(response)
             raise Exception("Failed to get answer from OpenAI")
 
+        usage = response.get('usage') or {}
+        if usage:
+            self._record_usage(deployment, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
         return answer
 
-    def upload(self, limit=None):
-        pages_to_upload = [page for page in self.pages.copy() if page.get("text") != ""]
+    @staticmethod
+    def _record_usage(deployment: str, prompt_tokens: int, completion_tokens: int) -> None:
+        """Token counts of one answer"""
+        metrics.observe('llm_prompt_tokens', prompt_tokens, TOKEN_BUCKETS, deployment=deployment)
+        metrics.observe('llm_completion_tokens', completion_tokens, TOKEN_BUCKETS, deployment=deployment)
+        metrics.inc('llm_prompt_tokens_total', prompt_tokens, deployment=deployment)
+        metrics.inc('llm_completion_tokens_total', completion_tokens, deployment=deployment)
 
-        # 1. Get all data from Weaviate
-        weaviate_data = self._get_all_articles()
+    def _stream_complete(self, data: dict, deployments: list):
+        """
+        Chat completion of the prepared request, piece by piece as it is generated.
+        Fails over to the next deployment as long as nothing was generated yet
+        """
+        for idx, deployment in enumerate(deployments):
+            started = time.perf_counter()
+            stream = self._llm.stream(deployment, data, None if idx == len(deployments) - 1 else 0)
+            try:
+                answer = next(stream, "")
+            except Exception as e:
+                self._failover(deployments, idx, e)
+                continue
+            self._router.record_success(deployment, time.perf_counter() - started)
+
+            if answer:
+                yield answer
+            for delta in stream:
+                answer += delta
+                yield delta
+
+            # Streamed completions carry no usage, the token counts are estimated
+            prompt = "".join(message["content"] for message in data["messages"])
+            self._record_usage(deployment, count_tokens(prompt), count_tokens(answer))
+            return
+
+    def _embed_records(self, records: list):
+        """
+        Vectors of the records for the import, mostly from the vector cache.
+        None lets Weaviate vectorize the records itself, when the embeddings deployment is not available
+        """
+        if not records:
+            return None
+        try:
+            with metrics.span('embed_records'):
+                return self._embedding_stage.embed_texts([f"{record['title']}\n{record['text']}" for record in records])
+        except Exception as e:
+            ic(f'Failed to embed the records, Weaviate will vectorize them: {e}')
+            return None
+
+    def _embed_query(self, query: str):
+        """Embedding of the question, None when the embeddings deployment is not available"""
+        try:
+            return self._embeddings.embed_query(query)
+        except Exception as e:
+            ic(f'Failed to embed the question: {e}')
+            return None
 
-        # 2. Iterate through data, if last_edited is the same, then remove it from pages to load
-        for article in weaviate_data:
-            last_edited = article.get("last_edited")
-            if last_edited:
-                # should it compare their time?
-                pages_to_upload = [page for page in pages_to_upload if page.get("last_edited") != last_edited]
+    def upload(self, limit=None) -> dict:
+        """
+        Delta sync of the loaded pages into Weaviate.
+        New and changed pages are (re-)uploaded under a uuid derived from their article_id,
+        articles that are gone from Confluence are deleted. Returns the article ids per category.
+        """
+        self._client.ensure_class(article_class)
+        self._client.ensure_class(passage_class)
 
-        if limit is not None:
-            pages_to_upload = pages_to_upload[:limit]
+        local_index = {}
+        for page in self.pages:
+            if page.get("text") != "":
+                page['content_hash'] = self._content_hash(page)
+                local_index[page['article_id']] = page
+
+        with metrics.span('remote_index'):
+            remote_index = self._build_remote_index()
+
+        new, changed, unchanged, stale = [], [], [], {}
+        for article_id, page in local_index.items():
+            remote = remote_index.get(article_id)
+            expected_uuid = WeaviateFacade.object_uuid('Article', page)
+
+            if remote is None:
+                new.append(article_id)
+                continue
+
+            # Objects uploaded under another uuid (e.g. content based uuids) are never overwritten
+            stale[article_id] = [uuid for uuid in remote['uuids'] if uuid != expected_uuid]
+            if remote['content_hash'] == page['content_hash'] and expected_uuid in remote['uuids']:
+                unchanged.append(article_id)
+            else:
+                changed.append(article_id)
 
-        ic(f'Total of {len(pages_to_upload)} pages are uploading')
+        deleted = [article_id for article_id in remote_index if article_id not in local_index]
+        for article_id in deleted:
+            stale[article_id] = remote_index[article_id]['uuids']
 
-        self._client.upload_data(pages_to_upload, 'Article')
+        pages_to_upload = [local_index[article_id] for article_id in new + changed]
+        if limit is not None:
+            pages_to_upload = pages_to_upload[:limit]
+            # Keep the old objects of the pages that were not uploaded in this run
+            not_uploaded = set(new + changed) - {page['article_id'] for page in pages_to_upload}
+            stale = {article_id: uuids for article_id, uuids in stale.items() if article_id not in not_uploaded}
+
+        ic(f'Total of {len(pages_to_upload)} pages are uploading ({len(new)} new, {len(changed)} changed)')
+        self._report('upload', new=len(new), changed=len(changed), deleted=len(deleted), unchanged=len(unchanged))
+
+        vectors = self._embed_records(pages_to_upload)
+        with metrics.span('import', data_type='Article'):
+            self._client.upload_data(pages_to_upload, 'Article', vectors)
+        stale_uuids = [uuid for uuids in stale.values() for uuid in uuids]
+        if stale_uuids:
+            self._client.delete_objects(stale_uuids, 'Article')
+
+        replaced = [page['article_id'] for page in pages_to_upload if page['article_id'] in changed]
+        added = len(pages_to_upload) > len(replaced)
+        self._sync_passages(pages_to_upload, replaced + deleted, [local_index[article_id] for article_id in unchanged])
+
+        # Questions the cached answers had no article for may be answered by the new ones
+        self._store.publish_changes(replaced + deleted, everything=added)
+        self._sync_answer_cache()
+        if self.RETRIEVAL_BACKEND != 'weaviate':
+            self._refresh_local_index(list(local_index.values()))
 
         ic(f'Total of {len(pages_to_upload)} articles were uploaded')
+        ic(f'Total of {len(deleted)} articles were deleted because they are gone from Confluence')
+        ic(f'Total of {len(unchanged)} files were skipped because they are already in Weaviate')
 
-        # Advanced logging to show skipped files
-        skipped_files = [page for page in self.pages if
-                         page.get("last_edited") in [article.get("last_edited") for article in weaviate_data]]
-        ic(f'Total of {len(skipped_files)} files were skipped because they are already in Weaviate')
+        return {'new': new, 'changed': changed, 'deleted': deleted, 'unchanged': unchanged}
 
     @classmethod
-    def _adf_to_plain_text(cls, node, is_root=True):
-        """Convert an ADF node to its plain text representation, ensuring better spacing between block elements."""
-        node_type = node.get("type", "")
-
-        # Base case: if the node is a text node
-        if node_type == "text":
-            text = node.get("text", "")
-            marks = node.get("marks", [])
-
-            for mark in marks:
-                mark_type = mark.get("type", "")
-                # Handle some of the marks. Others can be added as needed.
-                if mark_type == "link":
-                    url = mark.get("attrs", {}).get("url", "")
-                    text = f"{text} <{url}>"
-                # Other mark types can be added here as required
-
-            return text
-
-        # If the node is a list item, add a newline at the end
-        elif node_type == "listItem":
-            return "".join(
-                cls._adf_to_plain_text(child_node, is_root=False) for child_node in node.get("content", [])) + "\n"
-
-        # If the node is a code block, wrap the content in backticks
-        elif node_type == "codeBlock":
-            return f"```\n{''.join(cls._adf_to_plain_text(child_node, is_root=False) for child_node in node.get('content', []))}\n```\n"
-
-        # If the node is a bullet list, add bullet points before each item
-        elif node_type == "bulletList":
-            return "\n".join(
-                f"- {cls._adf_to_plain_text(child_node, is_root=False)}" for child_node in node.get("content", []))
-
-        # Recursive case: if the node has content
-        content = node.get("content", [])
-
-        # Add a newline between block elements but not within inline content
-        separator = "\n" if is_root else ""
-        return separator.join(cls._adf_to_plain_text(child_node, is_root=False) for child_node in content).strip()
-
-    def _download_pages(self, debug=False, cache=True):
-        endpoint = "/api/v2/spaces/1474564/pages?body-format=atlas_doc_format&status=current&start=0&limit=250"
-        auth = HTTPBasicAuth(self.CONFLUENCE_USERNAME, self.CONFLUENCE_API_TOKEN)
-        headers = {"Accept": "application/json"}
-
-        pages = []
-        while True:
-            response = requests.get(self.BASE_URL + endpoint, headers=headers, auth=auth)
-            if response.status_code != 200:
-                raise Exception("Failed to fetch space content. Status code:", response.status_code)
-
-            json_data = response.json()
-            pages.append(json_data)
-
-            if 'next' in json_data['_links']:
-                endpoint = json_data['_links']['next']
-            else:
-                break
-
-        # Merge batches of pages into a single array
-        merged_pages = []
-        for batch in pages:
-            merged_pages.extend(batch['results'])
-
-        # Process the merged pages
-        page_values = []
-        for page in merged_pages:
-            text = self._adf_to_plain_text(json.loads(page['body']['atlas_doc_format']['value']))
-            page_value = {
-                'article_id': page['id'],
-                'title': page['title'],
-                'last_edited': page['version']['createdAt'],
-                'text': text,
-                'words': len(text.split())
-            }
-            page_values.append(page_value)
+    def page_value(cls, page) -> dict:
+        with metrics.span('adf_parse'):
+            text = cls._adf_cache.render(page['id'], page['version']['number'], page['body']['atlas_doc_format']['value'])
+        return {
+            'article_id': page['id'],
+            'title': page['title'],
+            'version': page['version']['number'],
+            'last_edited': page['version']['createdAt'],
+            'text': text,
+            'words': len(text.split())
+        }
+
+    def iter_space_pages(self):
+        """
+        Pages of the space straight from Confluence, yielded batch by batch as they arrive.
+        Every page gets its language, new and changed pages are written to the page store on the way
+        and pages that are gone are deleted from it once the whole space was read
+        """
+        stored = self._store.versions()
+        seen = set()
+
+        for batch in self._confluence.iter_page_batches():
+            page_values = [self.page_value(page) for page in batch['results']]
+            self._language_detector.detect_pages(page_values)
+            # Rows are only rewritten when something in them changed
+            self._store.upsert(page_values)
+            for page in page_values:
+                seen.add(page['article_id'])
+                yield page
+
+        # Only reached when the whole space was read
+        self._store.delete([article_id for article_id in stored if article_id not in seen])
+        self._store.mark_synced()
+        ic(f'Fetched {len(seen)} pages of the space')
+
+    def _download_changed_pages(self) -> list:
+        """
+        Two-phase download: list ids and versions of the space without bodies,
+        then fetch the bodies of the pages that are new or changed since they were stored only
+        """
+        listing = {page['id']: page for page in self._confluence.iter_page_versions()}
+        stored = self._store.versions()
+
+        changed_ids = [
+            article_id for article_id, page in listing.items()
+            if stored.get(article_id) != page['version']['number']
+        ]
+        ic(f'{len(changed_ids)} of {len(listing)} pages are new or changed')
+        self._report('download', listed=len(listing), changed=len(changed_ids))
+
+        if len(changed_ids) > len(listing) * self.FULL_DOWNLOAD_RATIO:
+            ic('Most of the space changed, downloading the whole space')
+            return [self.page_value(page) for page in self._confluence.iter_pages()]
+
+        changed = set(changed_ids)
+        page_values = self._store.get_many([article_id for article_id in listing if article_id not in changed])
+        page_values.extend(self.page_value(page) for page in self._confluence.fetch_pages(changed_ids))
+        return page_values
+
+    def _download_pages(self, debug=False, cache=True, incremental=None):
+        if incremental is None:
+            incremental = self.INCREMENTAL_SYNC
+
+        if incremental:
+            page_values = self._download_changed_pages()
+        else:
+            page_values = [self.page_value(page) for page in self._confluence.iter_pages()]
 
         if debug:
             # Calculate min, max, and average word count
@@ -294,11 +627,6 @@ Documentation: {documentation}
             # Plotting logic can be added here if required
 
         if cache:
-            self.save_pages(page_values)
+            self._store.replace(page_values)
 
         self.pages = page_values
-
-    @classmethod
-    def save_pages(cls, page_values):
-        with open(cls.save_location, 'w') as f:
-            json.dump(page_values, f)
@@ -0,0 +1,83 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from icecream import ic
+
+
+class BatchImporter:
+    """
+    Imports objects in concurrent batches whose size adapts to the observed latency and error rate:
+    it grows while batches come back fast and clean, and halves when they are slow or fail.
+    Objects rejected individually are retried on their own, up to max_retries times
+    """
+    MIN_BATCH_SIZE = 10
+    MAX_BATCH_SIZE = 1000
+    # Share of failed objects in a batch above which the batch size is halved
+    MAX_ERROR_RATE = 0.1
+
+    def __init__(self, send_batch, batch_size: int = None, workers: int = None,
+                 target_latency: float = None, max_retries: int = 3):
+        """send_batch(objects) posts one batch and returns the error message of every object (None when imported)"""
+        self.send_batch = send_batch
+        self.batch_size = batch_size or int(os.getenv("WEAVIATE_BATCH_SIZE", 100))
+        self.workers = workers or int(os.getenv("WEAVIATE_BATCH_WORKERS", 4))
+        self.target_latency = target_latency or float(os.getenv("WEAVIATE_BATCH_TARGET_LATENCY", 2.0))
+        self.max_retries = max_retries
+
+    def _adapt(self, latency: float, error_rate: float) -> None:
+        if error_rate > self.MAX_ERROR_RATE or latency > self.target_latency:
+            self.batch_size = max(self.MIN_BATCH_SIZE, self.batch_size // 2)
+        elif latency < self.target_latency / 2:
+            self.batch_size = min(self.MAX_BATCH_SIZE, int(self.batch_size * 1.5))
+
+    def _send(self, batch: list) -> tuple:
+        started = time.perf_counter()
+        try:
+            errors = self.send_batch([obj for obj, _ in batch])
+        except Exception as e:
+            errors = [repr(e)] * len(batch)
+        return batch, errors, time.perf_counter() - started
+
+    def import_objects(self, objects: list) -> dict:
+        """Import the objects and return a summary with the errors of the objects that could not be imported"""
+        started = time.perf_counter()
+        pending = deque((obj, 0) for obj in objects)
+        failed = []
+        imported = batches = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = set()
+            while pending or in_flight:
+                while pending and len(in_flight) < self.workers:
+                    batch = [pending.popleft() for _ in range(min(self.batch_size, len(pending)))]
+                    in_flight.add(executor.submit(self._send, batch))
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, errors, latency = future.result()
+                    batches += 1
+                    error_count = 0
+                    for (obj, attempts), error in zip(batch, errors):
+                        if error is None:
+                            imported += 1
+                            continue
+                        error_count += 1
+                        if attempts < self.max_retries:
+                            pending.append((obj, attempts + 1))
+                        else:
+                            failed.append({'id': obj.get('id'), 'error': error})
+                    self._adapt(latency, error_count / len(batch))
+
+        seconds = time.perf_counter() - started
+        summary = {
+            'imported': imported,
+            'failed': failed,
+            'batches': batches,
+            'seconds': round(seconds, 2),
+            'objects_per_second': round(imported / seconds, 1) if seconds else 0,
+            'final_batch_size': self.batch_size,
+        }
+        ic(f"Imported {imported} objects, {len(failed)} failed, {summary['objects_per_second']} objects/sec")
+        return summary
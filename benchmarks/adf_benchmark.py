@@ -0,0 +1,95 @@
+"""
+Micro-benchmark of the ADF to text conversion on large synthetic pages.
+
+    python benchmarks/adf_benchmark.py [--pages 200] [--blocks 400] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adf_renderer import AdfTextCache, render_adf  # noqa: E402
+
+WORDS = "zoom absence jobcenter internship certificate laptop password moodle slack course".split()
+
+
+def _text(rng):
+    node = {"type": "text", "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))) + " "}
+    if rng.random() < 0.1:
+        node["marks"] = [{"type": "link", "attrs": {"url": "https://example.com"}}]
+    return node
+
+
+def _paragraph(rng):
+    return {"type": "paragraph", "content": [_text(rng) for _ in range(rng.randint(1, 5))]}
+
+
+def _block(rng):
+    kind = rng.random()
+    if kind < 0.2:
+        items = [{"type": "listItem", "content": [_paragraph(rng)]} for _ in range(rng.randint(2, 8))]
+        return {"type": "bulletList", "content": items}
+    if kind < 0.3:
+        return {"type": "codeBlock", "content": [_text(rng)]}
+    if kind < 0.4:
+        return {"type": "heading", "attrs": {"level": rng.randint(1, 3)}, "content": [_text(rng)]}
+    return _paragraph(rng)
+
+
+def make_page(rng, blocks):
+    return {"type": "doc", "version": 1, "content": [_block(rng) for _ in range(blocks)]}
+
+
+def make_nested_page(depth):
+    """A page nested deeper than the interpreter recursion limit"""
+    node = {"type": "text", "text": "deep"}
+    for _ in range(depth):
+        node = {"type": "paragraph", "content": [node]}
+    return {"type": "doc", "content": [node]}
+
+
+def _timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--blocks", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    raw_pages = [json.dumps(make_page(rng, args.blocks)) for _ in range(args.pages)]
+    size_mb = sum(len(page) for page in raw_pages) / 1e6
+    print(f"{args.pages} pages, {size_mb:.1f} MB of ADF json")
+
+    parse_and_render = _timed(lambda: [render_adf(json.loads(page)) for page in raw_pages], args.repeat)
+    print(f"parse + render:      {parse_and_render * 1000:8.1f} ms  ({args.pages / parse_and_render:8.0f} pages/s)")
+
+    documents = [json.loads(page) for page in raw_pages]
+    render_only = _timed(lambda: [render_adf(document) for document in documents], args.repeat)
+    print(f"render only:         {render_only * 1000:8.1f} ms  ({args.pages / render_only:8.0f} pages/s)")
+
+    cache = AdfTextCache()
+    for idx, page in enumerate(raw_pages):
+        cache.render(str(idx), 1, page)
+    cached = _timed(lambda: [cache.render(str(idx), 1, page) for idx, page in enumerate(raw_pages)], args.repeat)
+    print(f"cached:              {cached * 1000:8.1f} ms  ({args.pages / cached:8.0f} pages/s)")
+
+    depth = sys.getrecursionlimit() * 5
+    deep = _timed(lambda: render_adf(make_nested_page(depth)), 1)
+    print(f"nesting depth {depth}: {deep * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+End-to-end benchmark of the sync and the question answering against local stand-ins
+for Confluence, Weaviate and Azure OpenAI (see fake_services.py).
+
+    python benchmarks/e2e_benchmark.py [--pages 500] [--blocks 40] [--questions 200] [--concurrency 16]
+                                       [--json results.json] [--baseline results.json --tolerance 0.25]
+
+Phases: full sync, incremental sync after a day of edits, ask_question under concurrent load,
+and the Flask routes under concurrent load. With --baseline the run fails when a latency percentile
+or a throughput is worse than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_services import FakeAzureOpenAI, FakeConfluence, FakeWeaviate  # noqa: E402
+from adf_benchmark import WORDS  # noqa: E402
+
+
+def percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+
+    def pick(share):
+        return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else None
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'count': len(ordered)}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Phase:
+    """Times a phase and records its Python memory peak (with --trace-memory) and the process RSS peak"""
+
+    def __init__(self, results: dict, name: str, trace_memory: bool):
+        self.result = results.setdefault(name, {})
+        self.name = name
+        self.trace_memory = trace_memory
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        return self.result
+
+    def __exit__(self, *exc):
+        self.result['seconds'] = round(time.perf_counter() - self.started, 3)
+        if self.trace_memory:
+            self.result['python_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+            tracemalloc.stop()
+        self.result['rss_peak_mb'] = peak_rss_mb()
+        print(f"{self.name}: {json.dumps(self.result)}")
+
+
+def timed_calls(fn, args_list: list, concurrency: int) -> tuple:
+    """Latencies of fn(*args) for every args, run from `concurrency` threads, and the wall time"""
+    def call(args):
+        started = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, args_list))
+    return latencies, time.perf_counter() - started
+
+
+def make_questions(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [f"How do I handle {' '.join(rng.sample(WORDS, 4))} number {idx}?" for idx in range(count)]
+
+
+def configure_environment(confluence, weaviate, azure) -> None:
+    """Point the app at the stand-ins; must run before the app modules are imported"""
+    os.environ.update({
+        'WEAVIATE_URL': weaviate.url,
+        'WEAVIATE_API_KEY': 'benchmark',
+        'AZURE_OPENAI_KEY': 'benchmark',
+        'AZURE_OPENAI_BASE': azure.url,
+        'GPT4_DEPLOYMENT_ID': 'gpt4',
+        'GPT35_DEPLOYMENT_ID': 'gpt35',
+        'CONFLUENCE_USERNAME': 'benchmark',
+        'CONFLUENCE_API_TOKEN': 'benchmark',
+        'SYNC_SCHEDULE_ENABLED': '0',
+        'MOODLE_TOKEN': 'benchmark',
+        # The bag of words embeddings of the stand-ins are not calibrated like the real ones
+        'CONFIDENCE_MIN_CERTAINTY': '0',
+        # Benchmark traffic must not reach the Sentry project of the app
+        'SENTRY_DSN': '',
+        # The stub has no quota, the client side limiter must not be what is measured
+        'AZURE_OPENAI_RPM': '1000000',
+        'AZURE_OPENAI_TPM': '1000000000',
+    })
+
+
+def run_sync(operator, results: dict, name: str, trace_memory: bool) -> None:
+    with Phase(results, name, trace_memory) as result:
+        started = time.perf_counter()
+        operator.load_pages()
+        load_seconds = time.perf_counter() - started
+        result['pages'] = len(operator.pages)
+        result['load_pages_per_second'] = round(len(operator.pages) / load_seconds, 1)
+
+        started = time.perf_counter()
+        summary = operator.upload()
+        upload_seconds = time.perf_counter() - started
+        uploaded = len(summary['new']) + len(summary['changed'])
+        result.update({key: len(value) for key, value in summary.items()})
+        result['upload_seconds'] = round(upload_seconds, 3)
+        result['upload_pages_per_second'] = round(uploaded / upload_seconds, 1) if uploaded else None
+
+
+def run_questions(operator, questions: list, concurrency: int, results: dict, trace_memory: bool) -> None:
+    from answer_cache import AnswerCache
+
+    with Phase(results, 'ask_question', trace_memory) as result:
+        type(operator).answer_cache = AnswerCache()
+        latencies, seconds = timed_calls(operator.ask_question, [(question,) for question in questions], concurrency)
+        result.update(percentiles(latencies))
+        result['questions_per_second'] = round(len(questions) / seconds, 2)
+
+    with Phase(results, 'ask_question_repeated', trace_memory) as result:
+        latencies, seconds = timed_calls(operator.ask_question, [(question,) for question in questions], concurrency)
+        result.update(percentiles(latencies))
+        result['questions_per_second'] = round(len(questions) / seconds, 2)
+        result['answer_cache'] = type(operator).answer_cache.stats()
+
+
+def run_routes(questions: list, concurrency: int, results: dict, trace_memory: bool) -> None:
+    import requests
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from application import application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, application, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def ask_stream(question):
+        with session().get(
+            f"{base}/ask/stream", params={'question': question}, stream=True,
+            headers={'Authorization': f"Bearer {os.environ['MOODLE_TOKEN']}"},
+        ) as response:
+            for _ in response.iter_content(chunk_size=None):
+                pass
+
+    def space_pages(headers):
+        response = session().get(f"{base}/confluence/space/AllSpacePages", headers=headers)
+        response.raise_for_status()
+
+    try:
+        with Phase(results, 'route_ask_stream', trace_memory) as result:
+            latencies, seconds = timed_calls(ask_stream, [(question,) for question in questions], concurrency)
+            result.update(percentiles(latencies))
+            result['requests_per_second'] = round(len(questions) / seconds, 2)
+
+        etag = session().get(f"{base}/confluence/space/AllSpacePages").headers.get('ETag')
+        for name, headers in (('route_space_pages', {'Accept-Encoding': 'identity'}),
+                              ('route_space_pages_gzip', {'Accept-Encoding': 'gzip'}),
+                              ('route_space_pages_not_modified', {'If-None-Match': etag or ''})):
+            with Phase(results, name, trace_memory) as result:
+                latencies, seconds = timed_calls(space_pages, [(headers,)] * concurrency * 4, concurrency)
+                result.update(percentiles(latencies))
+                result['requests_per_second'] = round(concurrency * 4 / seconds, 2)
+
+        with Phase(results, 'route_ready', trace_memory) as result:
+            latencies, seconds = timed_calls(lambda: session().get(f"{base}/ready"), [()] * 500, concurrency)
+            result.update(percentiles(latencies))
+            result['requests_per_second'] = round(500 / seconds, 1)
+    finally:
+        server.shutdown()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that are worse than the baseline by more than the tolerance"""
+    regressions = []
+    for phase, metrics in baseline.items():
+        if not isinstance(metrics, dict):
+            continue
+        for key, expected in metrics.items():
+            actual = results.get(phase, {}).get(key)
+            if not isinstance(expected, (int, float)) or not isinstance(actual, (int, float)) or not expected:
+                continue
+            if key in ('p50', 'p95', 'p99') and actual > expected * (1 + tolerance):
+                regressions.append(f"{phase}.{key}: {actual:.3f}s, baseline {expected:.3f}s")
+            elif key.endswith('per_second') and actual < expected * (1 - tolerance):
+                regressions.append(f"{phase}.{key}: {actual}, baseline {expected}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--blocks", type=int, default=40)
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension of the stand-ins")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--confluence-latency", type=float, default=0.02)
+    parser.add_argument("--weaviate-latency", type=float, default=0.005)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.005)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--trace-memory", action="store_true", help="also record the Python allocation peak per phase (slower)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    json_location = args.json and os.path.abspath(args.json)
+    baseline_location = args.baseline and os.path.abspath(args.baseline)
+
+    confluence = FakeConfluence(args.pages, args.blocks, args.confluence_latency)
+    weaviate = FakeWeaviate(args.dim, args.weaviate_latency)
+    azure = FakeAzureOpenAI(args.dim, first_token_latency=args.first_token_latency,
+                            token_interval=args.token_interval, completion_tokens=args.completion_tokens)
+    configure_environment(confluence, weaviate, azure)
+
+    # Runtime files of the app (page store, caches, indexes) go to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="e2e-benchmark-")
+    os.chdir(workdir)
+    print(f"{args.pages} pages of {args.blocks} blocks, working in {workdir}")
+
+    from confluence_client import ConfluenceClient
+    import services
+
+    ConfluenceClient.BASE_URL = f"{confluence.url}/wiki"
+    operator = services.get_operator()
+    questions = make_questions(args.questions)
+    results = {}
+
+    run_sync(operator, results, 'sync_full', args.trace_memory)
+    confluence.mutate()
+    run_sync(operator, results, 'sync_incremental', args.trace_memory)
+    run_questions(operator, questions, args.concurrency, results, args.trace_memory)
+    run_routes(make_questions(args.questions, seed=2), args.concurrency, results, args.trace_memory)
+
+    operator._llm.close()
+    from metrics import metrics
+    results['stages'] = {
+        series: {'count': snapshot['count'], 'seconds': round(snapshot['sum'], 3)}
+        for series, snapshot in metrics.snapshot().items() if series.startswith('stage_duration_seconds')
+    }
+    for series, stage in sorted(results['stages'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"{series}: {stage['seconds']}s in {stage['count']} calls")
+    results['requests'] = {'confluence': confluence.requests, 'weaviate': weaviate.requests, 'azure': azure.requests}
+    results['rss_peak_mb'] = peak_rss_mb()
+    print(f"requests to the stand-ins: {json.dumps(results['requests'])}, RSS peak {results['rss_peak_mb']} MB")
+
+    if json_location:
+        with open(json_location, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if baseline_location:
+        with open(baseline_location, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Local stand-ins for the Confluence v2 pages API, Weaviate and Azure OpenAI, for the benchmarks.
+They implement just the requests the app makes, in memory, with tunable latency.
+"""
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid as uuid_lib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
+
+from adf_benchmark import WORDS, make_page
+
+SPACE_ID = "1474564"
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """Deterministic bag of words vector, so texts sharing words are near each other"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        vector[int.from_bytes(digest[:4], "little") % dim] += 1 if digest[4] & 1 else -1
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        service = self.server.service
+        service.requests += 1
+        if service.latency:
+            time.sleep(service.latency)
+        try:
+            service.handle(self, method)
+        except BrokenPipeError:
+            pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping their pooled keep-alive connections is no error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeService:
+    """An HTTP server on a free local port, running in a daemon thread"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.server = _Server(("127.0.0.1", 0), _Handler)
+        self.server.service = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def handle(self, handler: _Handler, method: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+class FakeConfluence(FakeService):
+    """Pages API of one space with cursor pagination; page bodies are synthetic ADF documents"""
+
+    def __init__(self, pages: int = 500, blocks: int = 40, latency: float = 0.0, seed: int = 0):
+        super().__init__(latency)
+        rng = random.Random(seed)
+        self._rng = rng
+        self.blocks = blocks
+        self.pages = {
+            str(100000 + idx): self._page(str(100000 + idx), 1, json.dumps(make_page(rng, blocks)))
+            for idx in range(pages)
+        }
+
+    def _page(self, page_id: str, version: int, adf: str) -> dict:
+        return {
+            "id": page_id,
+            "title": " ".join(self._rng.choice(WORDS) for _ in range(4)).capitalize(),
+            "version": {"number": version, "createdAt": "2024-01-01T00:00:00.000Z"},
+            "_adf": adf,
+        }
+
+    def mutate(self, changed: float = 0.05, deleted: float = 0.01, added: float = 0.01) -> None:
+        """Edit, delete and add a share of the pages, like a day of work in the space"""
+        ids = list(self.pages)
+        for page_id in self._rng.sample(ids, int(len(ids) * changed)):
+            page = self.pages[page_id]
+            self.pages[page_id] = {
+                **page,
+                "version": {**page["version"], "number": page["version"]["number"] + 1},
+                "_adf": json.dumps(make_page(self._rng, self.blocks)),
+            }
+        for page_id in self._rng.sample(ids, int(len(ids) * deleted)):
+            self.pages.pop(page_id, None)
+        next_id = max(int(page_id) for page_id in ids) + 1
+        for idx in range(int(len(ids) * added)):
+            page_id = str(next_id + idx)
+            self.pages[page_id] = self._page(page_id, 1, json.dumps(make_page(self._rng, self.blocks)))
+
+    @staticmethod
+    def _public(page: dict, body_format) -> dict:
+        result = {key: value for key, value in page.items() if key != "_adf"}
+        if body_format:
+            result["body"] = {body_format: {"value": page["_adf"], "representation": body_format}}
+        return result
+
+    def handle(self, handler, method):
+        url = urlparse(handler.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body_format = params.get("body-format")
+        limit = int(params.get("limit", 25))
+
+        if url.path == f"/wiki/api/v2/spaces/{SPACE_ID}/pages":
+            ids = sorted(self.pages)
+            start = int(params.get("cursor", 0))
+            results = [self._public(self.pages[page_id], body_format) for page_id in ids[start:start + limit]]
+            links = {}
+            if start + limit < len(ids):
+                links["next"] = f"{url.path}?{urlencode({**params, 'cursor': start + limit})}"
+            handler._send_json({"results": results, "_links": links})
+        elif url.path == "/wiki/api/v2/pages":
+            ids = params.get("id", "").split(",")
+            handler._send_json({
+                "results": [self._public(self.pages[page_id], body_format) for page_id in ids if page_id in self.pages],
+                "_links": {},
+            })
+        else:
+            handler._send_json({"message": "not found"}, 404)
+
+
+class FakeWeaviate(FakeService):
+    """
+    In-memory Weaviate: schema, batch import, deletes and the GraphQL Get queries the app sends
+    (cursor scans, nearVector and nearText). Objects without a vector get a fake embedding
+    """
+    GET_QUERY = re.compile(r"Get\s*{\s*(\w+)\s*(?:\(([^)]*)\))?\s*{(.*)}\s*}\s*}", re.S)
+
+    def __init__(self, dim: int = 64, latency: float = 0.0):
+        super().__init__(latency)
+        self.dim = dim
+        self.classes = {}
+        self.objects = {}  # class -> {uuid: (properties, vector)}
+        self._lock = threading.Lock()
+
+    def handle(self, handler, method):
+        path = urlparse(handler.path).path
+        if path in ("/v1/.well-known/ready", "/v1/.well-known/live"):
+            handler._send_json({})
+        elif path == "/v1/.well-known/openid-configuration":
+            handler._send_json({"message": "not configured"}, 404)
+        elif path == "/v1/meta":
+            handler._send_json({"version": "1.22.0", "modules": {}})
+        elif path == "/v1/schema" and method == "GET":
+            handler._send_json({"classes": list(self.classes.values())})
+        elif path == "/v1/schema" and method == "POST":
+            record_class = handler._body()
+            with self._lock:
+                self.classes[record_class["class"]] = record_class
+                self.objects.setdefault(record_class["class"], {})
+            handler._send_json(record_class)
+        elif path.startswith("/v1/schema/") and method == "DELETE":
+            with self._lock:
+                name = path[len("/v1/schema/"):]
+                self.classes.pop(name, None)
+                self.objects.pop(name, None)
+            handler._send_json({})
+        elif path.endswith("/properties") and method == "POST":
+            name = path.split("/")[3]
+            prop = handler._body()
+            with self._lock:
+                self.classes[name].setdefault("properties", []).append(prop)
+            handler._send_json(prop)
+        elif path.startswith("/v1/schema/"):
+            name = path[len("/v1/schema/"):]
+            if name in self.classes:
+                handler._send_json(self.classes[name])
+            else:
+                handler._send_json({"error": [{"message": "not found"}]}, 404)
+        elif path == "/v1/batch/objects" and method == "POST":
+            handler._send_json(self._import(handler._body()["objects"]))
+        elif path == "/v1/batch/objects" and method == "DELETE":
+            handler._send_json(self._delete_where(handler._body()["match"]))
+        elif path.startswith("/v1/objects/") and method == "DELETE":
+            _, _, _, name, object_id = path.split("/")
+            with self._lock:
+                self.objects.get(name, {}).pop(object_id, None)
+            handler.send_response(204)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+        elif path == "/v1/graphql":
+            handler._send_json(self._graphql(handler._body()["query"]))
+        else:
+            handler._send_json({"error": [{"message": f"unsupported {method} {path}"}]}, 404)
+
+    def _import(self, objects: list) -> list:
+        results = []
+        with self._lock:
+            for obj in objects:
+                properties = obj["properties"]
+                vector = obj.get("vector") or fake_embedding(f"{properties.get('title', '')}\n{properties.get('text', '')}", self.dim)
+                self.objects.setdefault(obj["class"], {})[obj["id"]] = (properties, np.asarray(vector, dtype=np.float32))
+                results.append({**obj, "vector": None, "result": {}})
+        return results
+
+    def _delete_where(self, match: dict) -> dict:
+        where = match["where"]
+        path, value = where["path"][0], where.get("valueText", where.get("valueString"))
+        with self._lock:
+            objects = self.objects.get(match["class"], {})
+            matched = [object_id for object_id, (properties, _) in objects.items() if properties.get(path) == value]
+            for object_id in matched:
+                del objects[object_id]
+        return {"results": {"matches": len(matched), "successful": len(matched), "failed": 0}}
+
+    def _graphql(self, query: str) -> dict:
+        match = self.GET_QUERY.search(query)
+        if match is None:
+            return {"errors": [{"message": "unsupported query"}]}
+        name, args, fields = match.group(1), match.group(2) or "", match.group(3)
+
+        additional = re.search(r"_additional\s*{([^}]*)}", fields)
+        additional_fields = additional.group(1).split() if additional else []
+        properties = (fields[:additional.start()] + fields[additional.end():] if additional else fields).split()
+
+        limit = int(re.search(r"limit:\s*(\d+)", args).group(1)) if "limit:" in args else 100
+        after = re.search(r'after:\s*"([^"]+)"', args)
+        vector = re.search(r"nearVector:\s*{\s*vector:\s*(\[[^\]]*\])", args)
+        concepts = re.search(r'nearText:\s*{\s*concepts:\s*\[?\s*"((?:[^"\\]|\\.)*)"', args)
+
+        with self._lock:
+            objects = list(self.objects.get(name, {}).items())
+
+        if vector or concepts:
+            query_vector = np.asarray(json.loads(vector.group(1)) if vector else fake_embedding(concepts.group(1), self.dim),
+                                      dtype=np.float32)
+            query_vector /= max(np.linalg.norm(query_vector), 1e-12)
+            scored = [(1 - float(stored_vector @ query_vector), object_id, stored)
+                      for object_id, (stored, stored_vector) in objects]
+            scored.sort(key=lambda item: item[0])
+            hits = [(object_id, stored, distance) for distance, object_id, stored in scored[:limit]]
+        else:
+            objects.sort(key=lambda item: item[0])
+            if after:
+                objects = [item for item in objects if item[0] > after.group(1)]
+            hits = [(object_id, stored, None) for object_id, (stored, _) in objects[:limit]]
+
+        results = []
+        for object_id, stored, distance in hits:
+            result = {prop: stored.get(prop) for prop in properties}
+            if additional_fields:
+                extra = {"id": object_id}
+                if distance is not None:
+                    extra.update(distance=distance, certainty=1 - distance / 2)
+                result["_additional"] = {key: extra.get(key) for key in additional_fields}
+            results.append(result)
+        return {"data": {"Get": {name: results}}}
+
+
+class FakeAzureOpenAI(FakeService):
+    """
+    Embeddings and chat completions deployments.
+    Completions wait `first_token_latency`, then emit `completion_tokens` words `token_interval` apart
+    """
+
+    def __init__(self, dim: int = 64, latency: float = 0.0, first_token_latency: float = 0.3,
+                 token_interval: float = 0.005, completion_tokens: int = 150):
+        super().__init__(latency)
+        self.dim = dim
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.completion_tokens = completion_tokens
+
+    def handle(self, handler, method):
+        path = urlparse(handler.path).path
+        if path.endswith("/embeddings"):
+            texts = handler._body()["input"]
+            handler._send_json({"data": [
+                {"index": idx, "embedding": fake_embedding(text, self.dim)} for idx, text in enumerate(texts)
+            ]})
+        elif path.endswith("/chat/completions"):
+            data = handler._body()
+            if data.get("stream"):
+                self._stream(handler)
+            else:
+                time.sleep(self.first_token_latency + self.token_interval * self.completion_tokens)
+                handler._send_json({
+                    "id": uuid_lib.uuid4().hex,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": self._answer()}}],
+                    "usage": {"prompt_tokens": 2000, "completion_tokens": self.completion_tokens,
+                              "total_tokens": 2000 + self.completion_tokens},
+                })
+        else:
+            handler._send_json({"error": {"message": "not found"}}, 404)
+
+    def _answer(self) -> str:
+        return " ".join(random.choice(WORDS) for _ in range(self.completion_tokens))
+
+    def _stream(self, handler) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def event(payload) -> None:
+            data = f"data: {payload}\n\n".encode("utf-8")
+            handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            handler.wfile.flush()
+
+        # Like Azure, the first event only carries the prompt filter results
+        event(json.dumps({"choices": [], "prompt_filter_results": []}))
+        time.sleep(self.first_token_latency)
+        for word in self._answer().split():
+            event(json.dumps({"choices": [{"index": 0, "delta": {"content": word + " "}}]}))
+            time.sleep(self.token_interval)
+        event("[DONE]")
+        handler.wfile.write(b"0\r\n\r\n")
@@ -0,0 +1,121 @@
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+def passage_key(passage: dict) -> tuple:
+    return passage.get('article_id'), passage.get('position')
+
+
+def reciprocal_rank_fusion(rankings: list, limit: int, k: int = 60) -> list:
+    """Fuse ranked passage lists: every list adds 1 / (k + rank) to the score of each of its passages"""
+    scores = defaultdict(float)
+    passages = {}
+    for ranking in rankings:
+        for rank, passage in enumerate(ranking):
+            key = passage_key(passage)
+            scores[key] += 1 / (k + rank + 1)
+            passages.setdefault(key, passage)
+
+    best = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [passages[key] for key in best]
+
+
+class BM25Index:
+    """
+    In-process inverted index over the passages with BM25 ranking.
+    Title terms are counted twice. Articles are replaced incrementally when their content changes
+    """
+    K1 = 1.5
+    B = 0.75
+    TITLE_WEIGHT = 2
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # term -> {passage key: term frequency}
+        self._lengths = {}  # passage key -> number of terms
+        self._passages = {}  # passage key -> passage
+        self._articles = {}  # article_id -> (fingerprint, passage keys)
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._passages)
+
+    @staticmethod
+    def fingerprint(page: dict) -> str:
+        return hashlib.sha1(f"{page['title']}\0{page['text']}".encode('utf-8')).hexdigest()
+
+    def sync_pages(self, pages: list, chunker) -> dict:
+        """
+        Bring the index in line with the pages: articles that are new or changed are (re-)indexed
+        with the passages from chunker(page), articles that are gone are removed
+        """
+        current = {page['article_id']: page for page in pages}
+        with self._lock:
+            gone = [article_id for article_id in self._articles if article_id not in current]
+            changed = [
+                page for article_id, page in current.items()
+                if self._articles.get(article_id, (None,))[0] != self.fingerprint(page)
+            ]
+            for article_id in gone + [page['article_id'] for page in changed]:
+                self._remove_article(article_id)
+            for page in changed:
+                self._add_article(page, chunker(page))
+
+        return {'indexed': len(changed), 'removed': len(gone)}
+
+    def _add_article(self, page: dict, passages: list) -> None:
+        keys = []
+        for passage in passages:
+            key = passage_key(passage)
+            terms = Counter(tokenize(passage['text']))
+            for term in tokenize(passage['title']):
+                terms[term] += self.TITLE_WEIGHT
+            for term, frequency in terms.items():
+                self._postings[term][key] = frequency
+            self._lengths[key] = sum(terms.values())
+            self._total_length += self._lengths[key]
+            self._passages[key] = passage
+            keys.append(key)
+        self._articles[page['article_id']] = (self.fingerprint(page), keys)
+
+    def _remove_article(self, article_id: str) -> None:
+        _, keys = self._articles.pop(article_id, (None, []))
+        for key in keys:
+            passage = self._passages.pop(key)
+            for term in set(tokenize(passage['text']) + tokenize(passage['title'])):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_length -= self._lengths.pop(key)
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """Best passages for the query, with their BM25 score"""
+        with self._lock:
+            count = len(self._passages)
+            if not count:
+                return []
+            average_length = self._total_length / count
+
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, frequency in postings.items():
+                    norm = self.K1 * (1 - self.B + self.B * self._lengths[key] / average_length)
+                    scores[key] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+            best = sorted(scores, key=scores.get, reverse=True)[:limit]
+            return [{**self._passages[key], '_additional': {'score': scores[key]}} for key in best]
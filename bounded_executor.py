@@ -0,0 +1,52 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    """Raised when all workers are busy and the queue is at its depth"""
+
+
+class KeyLimitReached(Exception):
+    """Raised when the key (e.g. a user) already has as many tasks as it is allowed to"""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded queue and a limit of tasks per key.
+    Submitting never blocks: work that does not fit is rejected, so the caller can tell the user right away
+    """
+
+    def __init__(self, workers: int, queue_depth: int, per_key_limit: int, name: str = "worker"):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.per_key_limit = per_key_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._pending = 0  # queued and running tasks
+        self._per_key = Counter()
+        self._lock = threading.Lock()
+        self.counters = {'accepted': 0, 'rejected_full': 0, 'rejected_key': 0}
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.queue_depth:
+                self.counters['rejected_full'] += 1
+                raise QueueFull(self._pending)
+            if self._per_key[key] >= self.per_key_limit:
+                self.counters['rejected_key'] += 1
+                raise KeyLimitReached(key)
+            self._pending += 1
+            self._per_key[key] += 1
+            self.counters['accepted'] += 1
+
+        return self._executor.submit(self._run, key, fn, *args)
+
+    def _run(self, key, fn, *args):
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._per_key[key] -= 1
+                if not self._per_key[key]:
+                    del self._per_key[key]
@@ -0,0 +1,128 @@
+import os
+import re
+
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", 200))
+CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", 40))
+# A heading only starts a new passage when the current one has at least this many words
+MIN_CHUNK_WORDS = 60
+
+_HEADING = re.compile(r"^#{1,6} ")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_blocks(text: str) -> list:
+    """
+    Split text rendered from ADF into (kind, text) blocks: headings, lists, code blocks and paragraphs.
+    The items of a list and the lines of a code block stay together
+    """
+    blocks = []
+    lines = text.split("\n")
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx]
+
+        if line.startswith("```"):
+            end = idx + 1
+            while end < len(lines) and not lines[end].startswith("```"):
+                end += 1
+            blocks.append(("code", "\n".join(lines[idx:end + 1])))
+            idx = end + 1
+
+        elif line.startswith("- "):
+            end = idx
+            items = []
+            while end < len(lines) and (lines[end].startswith("- ") or not lines[end].strip()):
+                if lines[end].strip():
+                    items.append(lines[end])
+                end += 1
+            blocks.append(("list", "\n".join(items)))
+            idx = end
+
+        else:
+            if _HEADING.match(line):
+                blocks.append(("heading", line))
+            elif line.strip():
+                blocks.append(("paragraph", line))
+            idx += 1
+
+    return blocks
+
+
+def _split_long_block(text: str, max_words: int) -> list:
+    """Split a block longer than max_words at sentence boundaries, or at word boundaries as a last resort"""
+    pieces, current = [], []
+    for sentence in _SENTENCE_END.split(text):
+        words = sentence.split()
+        if current and len(current) + len(words) > max_words and len(words) <= max_words:
+            pieces.append(" ".join(current))
+            current = []
+        current.extend(words)
+        while len(current) > max_words:
+            pieces.append(" ".join(current[:max_words]))
+            current = current[max_words:]
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_text(text: str, max_words: int = CHUNK_WORDS, overlap_words: int = CHUNK_OVERLAP_WORDS) -> list:
+    """
+    Pack the blocks of the text into overlapping passages of at most max_words (plus the overlap).
+    Passages start at headings where possible, lists and code blocks are only split when they are too long.
+    A passage that continues a section repeats the section heading and the tail of the previous passage
+    """
+    passages = []
+    # Parts of the passage being built and the number of its own words (repeated heading and overlap excluded)
+    parts, words = [], 0
+    heading = None
+
+    def emit():
+        """Close the current passage, returning the headings it ended with and the overlap for the next one"""
+        trailing = []
+        while parts and _HEADING.match(parts[-1]):
+            trailing.insert(0, parts.pop())
+        if not words:
+            return trailing, ""
+
+        passages.append("\n".join(parts))
+        body = " ".join(part for part in parts if not _HEADING.match(part)).split()
+        return trailing, " ".join(body[-overlap_words:]) if overlap_words else ""
+
+    for kind, block in split_blocks(text):
+        if kind == "heading":
+            heading = block
+            if words >= MIN_CHUNK_WORDS:
+                emit()
+                parts, words = [], 0
+            parts.append(block)
+            continue
+
+        block_words = len(block.split())
+        pieces = _split_long_block(block, max_words) if block_words > max_words else [block]
+        for piece in pieces:
+            piece_words = len(piece.split())
+            if words and words + piece_words > max_words:
+                trailing, tail = emit()
+                # A passage that ended with headings hands them over, the new section needs no overlap
+                parts = trailing or [part for part in (heading, tail) if part]
+                words = 0
+            parts.append(piece)
+            words += piece_words
+
+    emit()
+    return passages
+
+
+def chunk_page(page: dict, max_words: int = CHUNK_WORDS, overlap_words: int = CHUNK_OVERLAP_WORDS) -> list:
+    """Passage records of a page, linked back to it by article_id"""
+    return [
+        {
+            'chunk_id': f"{page['article_id']}-{position}",
+            'article_id': page['article_id'],
+            'title': page['title'],
+            'language': page['language'],
+            'position': position,
+            'text': text,
+        }
+        for position, text in enumerate(chunk_text(page['text'], max_words, overlap_words))
+    ]
@@ -0,0 +1,81 @@
+import os
+import re
+import threading
+
+from metrics import metrics
+
+SERVICE_DESK_URL = "https://digitalcareerinstitute.atlassian.net/servicedesk/customer/portal/1"
+
+_WORD = re.compile(r"\w+")
+
+
+class ConfidenceGate:
+    """
+    Decides whether a question is worth a chat completion: greetings, thanks and trivially short messages
+    are answered from a template, so are questions whose best passage is not similar enough to be relevant.
+    The similarity threshold applies to the vector certainty of the passages; keyword-only hits carry none,
+    and without any certainty the question passes
+    """
+    MIN_CERTAINTY = float(os.getenv("CONFIDENCE_MIN_CERTAINTY", 0.87))
+    MIN_QUESTION_CHARS = int(os.getenv("CONFIDENCE_MIN_QUESTION_CHARS", 4))
+    SMALL_TALK = {
+        "hi", "hello", "hey", "hallo", "moin", "servus", "good morning", "good evening", "guten morgen",
+        "guten tag", "thanks", "thank you", "thanks a lot", "thx", "danke", "danke schön", "vielen dank",
+        "ok", "okay", "cool", "great", "bye", "tschüss", "ciao", "test",
+    }
+
+    SMALL_TALK_REPLY = (
+        "Hi! I answer questions about everything covered in the Students portal, e.g. absence reporting, "
+        "internships or technical issues. What would you like to know? "
+        f"For personal requests you can also open a ticket in the service desk: {SERVICE_DESK_URL}"
+    )
+    OUT_OF_SCOPE_REPLY = (
+        "Sorry, I couldn't find anything about this in the Students portal documentation. "
+        f"Please open a request in the service desk, the team will help you there: {SERVICE_DESK_URL}"
+    )
+
+    def __init__(self, min_certainty: float = None, min_question_chars: int = None):
+        self.min_certainty = self.MIN_CERTAINTY if min_certainty is None else min_certainty
+        self.min_question_chars = self.MIN_QUESTION_CHARS if min_question_chars is None else min_question_chars
+        self._lock = threading.Lock()
+        self.counters = {'passed': 0, 'small_talk': 0, 'low_confidence': 0}
+
+    def is_small_talk(self, question: str) -> bool:
+        words = _WORD.findall(question.lower())
+        return " ".join(words) in self.SMALL_TALK or len("".join(words)) < self.min_question_chars
+
+    @staticmethod
+    def top_certainty(passages: list):
+        """Best vector certainty among the passages, None when no passage carries one"""
+        certainties = [
+            passage['_additional']['certainty'] for passage in passages
+            if (passage.get('_additional') or {}).get('certainty') is not None
+        ]
+        return max(certainties) if certainties else None
+
+    def check_question(self, question: str):
+        """The templated reply when the question is small talk, None when it goes on to retrieval"""
+        if self.is_small_talk(question):
+            self._count('small_talk')
+            return self.SMALL_TALK_REPLY
+        return None
+
+    def check_passages(self, passages: list):
+        """The templated reply when the retrieved passages are not relevant enough, None when the question passes"""
+        certainty = self.top_certainty(passages)
+        if not passages or certainty is not None and certainty < self.min_certainty:
+            self._count('low_confidence')
+            return self.OUT_OF_SCOPE_REPLY
+        self._count('passed')
+        return None
+
+    def _count(self, decision: str) -> None:
+        with self._lock:
+            self.counters[decision] += 1
+        metrics.inc('confidence_gate_total', decision=decision)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        total = sum(counters.values())
+        return {**counters, 'gated_ratio': round((total - counters['passed']) / total, 3) if total else 0.0}
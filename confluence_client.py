@@ -0,0 +1,117 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+
+
+class ConfluenceError(Exception):
+    """Raised when Confluence answers with a non successful status code"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message, status_code)
+        self.status_code = status_code
+
+
+class ConfluenceClient:
+    """
+    Client for the Confluence v2 API.
+    Keeps one pooled session with retries (429 Retry-After is honored) for all the requests
+    """
+    BASE_URL = "https://digitalcareerinstitute.atlassian.net/wiki"
+    SPACE_ID = "1474564"
+    PAGE_LIMIT = 250
+    BODY_BATCH_SIZE = 50
+    TIMEOUT = 60
+
+    def __init__(self, username: str = None, api_token: str = None, pool_size: int = 8, max_retries: int = 5):
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(
+            username or os.getenv("CONFLUENCE_USERNAME"),
+            api_token or os.getenv("CONFLUENCE_API_TOKEN")
+        )
+        self.session.headers.update({"Accept": "application/json"})
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _url(self, endpoint: str) -> str:
+        # _links.next is relative to the site root and already contains the /wiki prefix
+        if endpoint.startswith("/wiki/"):
+            endpoint = endpoint[len("/wiki"):]
+        return self.BASE_URL + endpoint
+
+    def get(self, endpoint: str, params: dict = None) -> dict:
+        response = self.session.get(self._url(endpoint), params=params, timeout=self.TIMEOUT)
+        if response.status_code != 200:
+            raise ConfluenceError("Failed to fetch space content", response.status_code)
+        return response.json()
+
+    def iter_page_batches(self, space_id: str = None, body_format: str = "atlas_doc_format",
+                          limit: int = None) -> Iterator[dict]:
+        """
+        Walk the pages of the space following the _links.next cursor.
+        The next batch is already requested while the caller processes the current one
+        """
+        endpoint = f"/api/v2/spaces/{space_id or self.SPACE_ID}/pages"
+        params = {"status": "current", "limit": limit or self.PAGE_LIMIT}
+        if body_format:
+            params["body-format"] = body_format
+
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            pending = prefetcher.submit(self.get, endpoint, params)
+            while pending is not None:
+                batch = pending.result()
+
+                next_endpoint = batch.get('_links', {}).get('next')
+                # The cursor link carries all the query params itself
+                pending = prefetcher.submit(self.get, next_endpoint) if next_endpoint else None
+
+                yield batch
+
+    def iter_pages(self, space_id: str = None, body_format: str = "atlas_doc_format",
+                   limit: int = None) -> Iterator[dict]:
+        """Yield the pages of the space one by one, as the batches arrive"""
+        for batch in self.iter_page_batches(space_id, body_format, limit):
+            yield from batch['results']
+
+    def iter_page_versions(self, space_id: str = None) -> Iterator[dict]:
+        """Yield {'id', 'title', 'version'} of every page of the space without downloading the bodies"""
+        for page in self.iter_pages(space_id, body_format=None):
+            yield {'id': page['id'], 'title': page['title'], 'version': page['version']}
+
+    def _get_pages_by_id(self, page_ids: list, body_format: str) -> list:
+        params = {"id": ",".join(page_ids), "body-format": body_format, "limit": len(page_ids)}
+        batch = self.get("/api/v2/pages", params)
+        pages = batch['results']
+        while batch.get('_links', {}).get('next'):
+            batch = self.get(batch['_links']['next'])
+            pages.extend(batch['results'])
+        return pages
+
+    def fetch_pages(self, page_ids: Iterable[str], body_format: str = "atlas_doc_format",
+                    batch_size: int = None, workers: int = 4) -> Iterator[dict]:
+        """
+        Download the given pages with their bodies.
+        Ids are requested in batches, several batches at a time; pages are yielded as soon as their batch arrives
+        """
+        page_ids = list(page_ids)
+        batch_size = batch_size or self.BODY_BATCH_SIZE
+        batches = [page_ids[i:i + batch_size] for i in range(0, len(page_ids), batch_size)]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._get_pages_by_id, batch, body_format) for batch in batches]
+            for future in as_completed(futures):
+                yield from future.result()
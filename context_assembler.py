@@ -0,0 +1,76 @@
+import os
+import re
+
+ARTICLE_URL = "https://digitalcareerinstitute.atlassian.net/servicedesk/customer/portal/1/article/"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text: str) -> int:
+    """Estimate of the number of GPT tokens, about 4 characters per token"""
+    return (len(text) + 3) // 4
+
+
+class ContextAssembler:
+    """
+    Builds the documentation part of the prompt from ranked passages within a token budget.
+    Passages of the same article are merged into one document with one link, sentences repeated
+    by overlapping passages are dropped, and the last passage that fits is cut at a sentence boundary
+    """
+
+    def __init__(self, budget_tokens: int = None):
+        self.budget_tokens = budget_tokens or int(os.getenv("CONTEXT_TOKEN_BUDGET", 2500))
+
+    @staticmethod
+    def _document(idx: int, article_id: str, text: str) -> str:
+        return f"Document {idx}: (link: {ARTICLE_URL}{article_id})\n```Text: {text}```\n\n"
+
+    def assemble(self, passages: list) -> tuple:
+        """
+        Documentation text for the passages (ordered best first) and the ids of the articles it uses.
+        The best ranked document is placed last, closest to the question
+        """
+        documents = {}  # article_id -> kept lines, articles in the order of their best passage
+        seen = set()
+        # Link and fences of a document
+        overhead = count_tokens(self._document(0, "0" * 10, ""))
+        used = 0
+        exhausted = False
+
+        for passage in passages:
+            article_id = passage.get("article_id", "")
+            if article_id not in documents:
+                if used + overhead >= self.budget_tokens:
+                    # No room for another document, passages of the included articles may still fit
+                    continue
+                documents[article_id] = []
+                used += overhead
+
+            for line in passage.get("text", "").replace("`", "").split("\n"):
+                kept = []
+                for sentence in _SENTENCE_END.split(line):
+                    key = " ".join(sentence.lower().split())
+                    if not key or key in seen:
+                        continue
+
+                    tokens = count_tokens(sentence) + 1
+                    if used + tokens > self.budget_tokens:
+                        exhausted = True
+                        break
+                    seen.add(key)
+                    kept.append(sentence.strip())
+                    used += tokens
+
+                if kept:
+                    documents[article_id].append(" ".join(kept))
+                if exhausted:
+                    break
+            if exhausted:
+                break
+
+        documents = [(article_id, lines) for article_id, lines in documents.items() if lines]
+        text = "".join(
+            self._document(idx + 1, article_id, "\n".join(lines))
+            for idx, (article_id, lines) in enumerate(reversed(documents))
+        )
+        return text, [article_id for article_id, _ in documents]
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from icecream import ic
+
+
+class AzureEmbeddings:
+    """Client of the Azure OpenAI embeddings deployment (the one Weaviate's text2vec-openai module uses)"""
+    API_VERSION = "2023-05-15"
+    TIMEOUT = 30
+
+    def __init__(self, deployment: str = None):
+        self.deployment = deployment or os.getenv("AZURE_EMBEDDING_DEPLOYMENT", "embeddings")
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "api-key": os.getenv('AZURE_OPENAI_KEY') or ""
+        })
+
+    @property
+    def url(self) -> str:
+        return f"{os.getenv('AZURE_OPENAI_BASE')}/openai/deployments/{self.deployment}/embeddings?api-version={self.API_VERSION}"
+
+    def embed(self, texts: list) -> list:
+        """Embedding vectors of the texts, in the same order"""
+        response = self.session.post(self.url, json={"input": texts}, timeout=self.TIMEOUT)
+        data = response.json()
+        if 'data' not in data:
+            raise Exception("Failed to get embeddings from OpenAI", data.get('error'))
+
+        return [item['embedding'] for item in sorted(data['data'], key=lambda item: item['index'])]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed([text])[0]
+
+
+class VectorCache:
+    """
+    Persistent vector cache keyed by (model, content hash).
+    Append-only binary file: a header with the dimension, then records of a 20 byte sha1 key and float32 values
+    """
+    MAGIC = b"VEC1"
+
+    def __init__(self, location: str = 'vector_cache.bin'):
+        self.location = location
+        self.dim = None
+        self._vectors = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        return hashlib.sha1(f"{model}\0{text}".encode('utf-8')).digest()
+
+    def _record_dtype(self):
+        return np.dtype([('key', 'S20'), ('vector', '<f4', (self.dim,))])
+
+    def _load(self) -> None:
+        try:
+            with open(self.location, 'rb') as file:
+                header = file.read(8)
+                if len(header) < 8 or header[:4] != self.MAGIC:
+                    return
+                self.dim = struct.unpack('<I', header[4:])[0]
+                raw = file.read()
+        except FileNotFoundError:
+            return
+
+        dtype = self._record_dtype()
+        # A record cut short by a crash is dropped
+        records = np.frombuffer(raw[:len(raw) - len(raw) % dtype.itemsize], dtype=dtype)
+        self._vectors = {self._key_bytes(record['key']): record['vector'] for record in records}
+
+    @staticmethod
+    def _key_bytes(key) -> bytes:
+        # numpy drops trailing NUL bytes of 'S' values, a sha1 digest can end with some
+        return bytes(key).ljust(20, b"\0")
+
+    def get(self, key: bytes):
+        return self._vectors.get(key)
+
+    def put_many(self, items: list) -> None:
+        """Store [(key, vector)] in memory and append them to the file"""
+        if not items:
+            return
+
+        with self._lock:
+            new_file = self.dim is None
+            if new_file:
+                self.dim = len(items[0][1])
+            records = np.zeros(len(items), dtype=self._record_dtype())
+            for idx, (key, vector) in enumerate(items):
+                records[idx] = (key, vector)
+
+            with open(self.location, 'wb' if new_file else 'ab') as file:
+                if new_file:
+                    file.write(self.MAGIC + struct.pack('<I', self.dim))
+                file.write(records.tobytes())
+
+            for record in records:
+                self._vectors[self._key_bytes(record['key'])] = record['vector']
+
+    def __len__(self):
+        return len(self._vectors)
+
+
+class EmbeddingStage:
+    """
+    Embeds texts for the import: cached vectors are reused, the missing ones are requested
+    from the embeddings deployment in batches, several batches at a time
+    """
+    # The embedding model reads at most 8191 tokens
+    MAX_CHARS = 20000
+
+    def __init__(self, embeddings: AzureEmbeddings = None, cache: VectorCache = None,
+                 batch_size: int = None, workers: int = 4):
+        self.embeddings = embeddings or AzureEmbeddings()
+        self.cache = cache or VectorCache()
+        self.model = os.getenv("AZURE_EMBEDDING_MODEL", "text-embedding-ada-002")
+        self.batch_size = batch_size or int(os.getenv("AZURE_EMBEDDING_BATCH_SIZE", 16))
+        self.workers = workers
+
+    def embed_texts(self, texts: list) -> list:
+        """Vectors of the texts, in the same order"""
+        texts = [text[:self.MAX_CHARS] for text in texts]
+        keys = [self.cache.key(self.model, text) for text in texts]
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if self.cache.get(key) is None:
+                missing.setdefault(key, text)
+
+        if missing:
+            started = time.perf_counter()
+            missing_keys = list(missing)
+            batches = [missing_keys[i:i + self.batch_size] for i in range(0, len(missing_keys), self.batch_size)]
+
+            def embed_batch(batch):
+                vectors = self.embeddings.embed([missing[key] for key in batch])
+                self.cache.put_many(list(zip(batch, vectors)))
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(embed_batch, batches))
+            ic(f'Embedded {len(missing)} texts in {len(batches)} requests in {time.perf_counter() - started:.1f}s')
+
+        ic(f'{len(texts) - len(missing)} of {len(texts)} vectors were taken from the cache')
+        return [self.cache.get(key).tolist() for key in keys]
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from icecream import ic
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
+
+
+def _init_worker(seed: int) -> None:
+    # langdetect is randomized, a fixed seed makes the results reproducible
+    DetectorFactory.seed = seed
+
+
+def _detect(text: str) -> str:
+    try:
+        return detect(text)
+    except LangDetectException:
+        return 'unknown'
+
+
+class LanguageDetector:
+    """
+    Language detection stage of the sync.
+    Detects on a bounded prefix of the text, in a process pool, and caches the results by content hash
+    """
+    SAMPLE_CHARS = 2000
+    # Below this number of texts starting the process pool costs more than it saves
+    POOL_THRESHOLD = 50
+
+    def __init__(self, cache_location: str = 'language_cache.json', workers: int = None, seed: int = 0):
+        self.cache_location = cache_location
+        self.workers = workers or int(os.getenv("LANGDETECT_WORKERS", 0)) or os.cpu_count() or 1
+        self.seed = seed
+        self._cache = self._load_cache()
+        # The sync and the space pages route share the detector and its cache file
+        self._lock = threading.Lock()
+        self._executor = None
+        _init_worker(seed)
+
+    @classmethod
+    def sample(cls, text: str) -> str:
+        """Prefix of the text that is enough to detect the language, cut at a word boundary"""
+        if len(text) <= cls.SAMPLE_CHARS:
+            return text
+        cut = text.rfind(' ', 0, cls.SAMPLE_CHARS)
+        return text[:cut if cut > 0 else cls.SAMPLE_CHARS]
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def detect_pages(self, pages: list) -> None:
+        """Set page['language'] for every given page"""
+        with self._lock:
+            self._detect_pages(pages)
+
+    def _detect_pages(self, pages: list) -> None:
+        started = time.perf_counter()
+
+        samples = {}
+        for page in pages:
+            sample = self.sample(page['text'])
+            samples.setdefault(self._hash(sample), sample)
+
+        missing = [key for key in samples if key not in self._cache]
+        if len(missing) >= self.POOL_THRESHOLD and self.workers > 1:
+            languages = self._pool().map(_detect, [samples[key] for key in missing], chunksize=16)
+            self._cache.update(zip(missing, languages))
+        else:
+            self._cache.update((key, _detect(samples[key])) for key in missing)
+
+        for page in pages:
+            page['language'] = self._cache[self._hash(self.sample(page['text']))]
+
+        if missing:
+            self._save_cache()
+
+        elapsed = time.perf_counter() - started
+        throughput = len(missing) / elapsed if elapsed else 0
+        ic(f'Detected {len(missing)} languages in {elapsed:.2f}s ({throughput:.0f} texts/sec, {self.workers} workers)')
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """
+        Process pool of the detector, started on first use and kept for the next syncs.
+        The workers are not forked from this process: its other threads may hold locks (logging, sqlite, sockets)
+        """
+        if self._executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context(method),
+                initializer=_init_worker, initargs=(self.seed,)
+            )
+        return self._executor
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _load_cache(self) -> dict:
+        try:
+            with open(self.cache_location, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self) -> None:
+        tmp_location = f'{self.cache_location}.tmp'
+        with open(tmp_location, 'w') as file:
+            json.dump(self._cache, file)
+        os.replace(tmp_location, self.cache_location)
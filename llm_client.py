@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import aiohttp
+from icecream import ic
+
+from context_assembler import count_tokens
+from metrics import metrics
+
+
+class DeploymentUnavailable(Exception):
+    """Raised when a deployment is still throttled or failing after the retries"""
+
+    def __init__(self, deployment: str, status: int):
+        super().__init__(deployment, status)
+        self.deployment = deployment
+        self.status = status
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `per_minute` per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        # More than the capacity can never be available, such a request waits for a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AzureChatClient:
+    """
+    Asyncio client of the Azure OpenAI chat completions API.
+    One pooled aiohttp session on a background event loop serves all the threads of the process.
+    Retries 429 and 5xx with exponential backoff and jitter, honoring Retry-After, and keeps every
+    deployment under its requests and tokens per minute limits
+    """
+    API_VERSION = "2023-05-15"
+    MAX_RETRIES = 4
+    BACKOFF_BASE = 1.0
+    BACKOFF_CAP = 30.0
+    # Tokens reserved for the completion when the request does not set max_tokens
+    EXPECTED_COMPLETION_TOKENS = 500
+
+    def __init__(self, base: str = None, api_key: str = None, timeout: float = None, pool_size: int = 32,
+                 requests_per_minute: float = None, tokens_per_minute: float = None):
+        self.base = base
+        self.api_key = api_key
+        self.timeout = timeout or float(os.getenv("AZURE_OPENAI_TIMEOUT", 60))
+        self.pool_size = pool_size
+        self.requests_per_minute = requests_per_minute or float(os.getenv("AZURE_OPENAI_RPM", 300))
+        self.tokens_per_minute = tokens_per_minute or float(os.getenv("AZURE_OPENAI_TPM", 40000))
+
+        self._loop = None
+        self._session = None
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    # Event loop
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="azure-openai", daemon=True).start()
+        return self._loop
+
+    def _run(self, coroutine):
+        """Run the coroutine on the client loop and wait for its result in the calling thread"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._session is not None:
+            self._run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = self._session = None
+
+    # Requests
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                headers={
+                    "Content-Type": "application/json",
+                    "api-key": self.api_key or os.getenv('AZURE_OPENAI_KEY') or ""
+                },
+            )
+        return self._session
+
+    def _url(self, deployment: str) -> str:
+        base = self.base or os.getenv('AZURE_OPENAI_BASE')
+        return f"{base}/openai/deployments/{deployment}/chat/completions?api-version={self.API_VERSION}"
+
+    async def _throttle(self, deployment: str, data: dict) -> None:
+        if deployment not in self._buckets:
+            self._buckets[deployment] = (TokenBucket(self.requests_per_minute), TokenBucket(self.tokens_per_minute))
+        requests_bucket, tokens_bucket = self._buckets[deployment]
+
+        prompt = "".join(message.get("content", "") for message in data.get("messages", []))
+        tokens = count_tokens(prompt) + data.get("max_tokens", self.EXPECTED_COMPLETION_TOKENS)
+        await requests_bucket.acquire(1)
+        await tokens_bucket.acquire(tokens)
+
+    def _backoff(self, attempt: int, headers=None) -> float:
+        """Delay before the next attempt: what the server asks for, otherwise exponential with full jitter"""
+        if headers:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("Retry-After", "").isdigit():
+                return float(headers["Retry-After"])
+        return random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt))
+
+    async def _post(self, deployment: str, data: dict, timeout: aiohttp.ClientTimeout,
+                    max_retries: int = None) -> aiohttp.ClientResponse:
+        """
+        POST the request, retrying throttled, failed and timed out attempts. The caller releases the response.
+        Raises DeploymentUnavailable when the last attempt is still throttled or failing
+        """
+        max_retries = self.MAX_RETRIES if max_retries is None else max_retries
+        session = await self._get_session()
+        for attempt in range(max_retries + 1):
+            await self._throttle(deployment, data)
+            try:
+                response = await session.post(self._url(deployment), json=data, timeout=timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                ic(f"Request to {deployment} failed ({e!r}), retrying in {delay:.1f}s")
+            else:
+                if response.status != 429 and response.status < 500:
+                    return response
+                if attempt == max_retries:
+                    response.release()
+                    raise DeploymentUnavailable(deployment, response.status)
+                delay = self._backoff(attempt, response.headers)
+                response.release()
+                ic(f"{deployment} answered {response.status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def acomplete(self, deployment: str, data: dict, max_retries: int = None) -> dict:
+        """Response of the chat completion"""
+        response = await self._post(deployment, data, aiohttp.ClientTimeout(total=self.timeout), max_retries)
+        async with response:
+            return await response.json(content_type=None)
+
+    async def astream(self, deployment: str, data: dict, max_retries: int = None):
+        """Pieces of the completion text, read from the server-sent events stream"""
+        started = time.perf_counter()
+        # The whole generation may take longer than the timeout, only the gaps between events may not
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        response = await self._post(deployment, {**data, "stream": True}, timeout, max_retries)
+
+        async with response:
+            if response.status != 200:
+                ic(await response.text())
+                raise Exception("Failed to get answer from OpenAI")
+
+            first_token = True
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+
+                choices = json.loads(payload).get("choices")
+                # The first event only carries the prompt filter results
+                if not choices:
+                    continue
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    if first_token:
+                        metrics.observe("llm_time_to_first_token_seconds", time.perf_counter() - started, deployment=deployment)
+                        first_token = False
+                    yield delta
+
+    # Blocking API for the threads of Flask and the Slack bot
+
+    def complete(self, deployment: str, data: dict, max_retries: int = None) -> dict:
+        return self._run(self.acomplete(deployment, data, max_retries))
+
+    def stream(self, deployment: str, data: dict, max_retries: int = None):
+        """Blocking generator over astream"""
+        pieces = queue.Queue()
+
+        async def pump():
+            try:
+                async for delta in self.astream(deployment, data, max_retries):
+                    pieces.put((True, delta))
+                pieces.put((False, None))
+            except BaseException as e:
+                # Also CancelledError: the consumer must not wait on the queue forever
+                pieces.put((False, e))
+                raise
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+        try:
+            while True:
+                is_delta, value = pieces.get()
+                if is_delta:
+                    yield value
+                elif value is not None:
+                    raise value
+                else:
+                    return
+        finally:
+            # The caller stopped reading: close the response instead of reading it to the end
+            future.cancel()
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+from icecream import ic
+
+
+class LocalVectorIndex:
+    """
+    In-process exact vector search over the passages.
+    Normalized float32 vectors are kept in one contiguous matrix, memory-mapped from disk,
+    and top-k is a single matrix product. Weaviate stays the authoritative store, this is a copy
+    rebuilt by the sync. Every build writes a new revision, processes that did not build it reload the files
+    """
+
+    def __init__(self, location: str = 'local_index'):
+        self.vectors_location = f'{location}_vectors.npy'
+        self.passages_location = f'{location}_passages.json'
+        self.revision_location = f'{location}_revision'
+        self._vectors = None
+        self._passages = []
+        self._revision = None
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def ready(self) -> bool:
+        self._reload_if_changed()
+        return self._vectors is not None and len(self._passages) > 0
+
+    def _read_revision(self):
+        try:
+            with open(self.revision_location, 'r') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self) -> None:
+        """Load the files again when another process built a new revision of the index"""
+        if self._read_revision() != self._revision:
+            self.load()
+
+    def load(self) -> None:
+        revision = self._read_revision()
+        try:
+            vectors = np.load(self.vectors_location, mmap_mode='r')
+            with open(self.passages_location, 'r') as file:
+                passages = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+
+        # A build that finished meanwhile may have replaced only one of the files, it is loaded on the next call
+        if self._read_revision() != revision:
+            return
+        self._revision = revision
+
+        if len(passages) != len(vectors):
+            ic('Local index files do not match, ignoring them')
+            return
+
+        with self._lock:
+            self._vectors, self._passages = vectors, passages
+        ic(f'Loaded local index of {len(passages)} passages')
+
+    def build(self, passages: list, vectors: list) -> None:
+        """Replace the index with the given passages and their vectors"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        # Written next to the live files and swapped in, so readers never see a half written index
+        np.save(f'{self.vectors_location}.tmp.npy', matrix)
+        with open(f'{self.passages_location}.tmp', 'w') as file:
+            json.dump(passages, file)
+        os.replace(f'{self.vectors_location}.tmp.npy', self.vectors_location)
+        os.replace(f'{self.passages_location}.tmp', self.passages_location)
+        # The revision goes last, readers only reload once both files are in place
+        with open(f'{self.revision_location}.tmp', 'w') as file:
+            file.write(uuid.uuid4().hex)
+        os.replace(f'{self.revision_location}.tmp', self.revision_location)
+
+        self.load()
+
+    def search_many(self, query_vectors, k: int = 5) -> list:
+        """Top-k passages for every query vector, scored like Weaviate does for cosine distance"""
+        self._reload_if_changed()
+        with self._lock:
+            vectors, passages = self._vectors, self._passages
+
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ vectors.T
+
+        k = min(k, len(passages))
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([
+                {**passages[idx], '_additional': {'distance': 1 - float(row[idx]), 'certainty': (1 + float(row[idx])) / 2}}
+                for idx in top
+            ])
+        return results
+
+    def search(self, query_vector, k: int = 5) -> dict:
+        """Same response shape as a Weaviate Get query on Passage"""
+        return {'data': {'Get': {'Passage': self.search_many([query_vector], k)[0]}}}
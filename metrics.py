@@ -0,0 +1,113 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import sentry_sdk
+
+# Upper bounds in seconds, suited to the latencies of this app (from cache hits to full syncs)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+class Histogram:
+    """Bucket histogram of observed values"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'buckets': dict(zip(self.buckets + (float('inf'),), self.counts)), 'sum': self.sum, 'count': self.count}
+
+
+def _series(name: str, labels: tuple, extra: str = None) -> str:
+    pairs = [f'{key}="{value}"' for key, value in labels] + ([extra] if extra else [])
+    return f"{name}{{{','.join(pairs)}}}" if pairs else name
+
+
+class Metrics:
+    """Process wide registry of named, optionally labelled, histograms and counters"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+            return self._histograms[key]
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels) -> None:
+        self.histogram(name, buckets, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """
+        Time a stage into stage_duration_seconds{stage=...}.
+        Within a sampled Sentry transaction the stage also shows up as a span of the trace
+        """
+        started = time.perf_counter()
+        try:
+            with sentry_sdk.start_span(op=stage):
+                yield
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        snapshot = {_series(name, labels): histogram.snapshot() for (name, labels), histogram in histograms.items()}
+        snapshot.update({_series(name, labels): value for (name, labels), value in counters.items()})
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            snapshot = histogram.snapshot()
+            cumulative = 0
+            for bound, count in snapshot['buckets'].items():
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{_series(name + '_bucket', labels, le)} {cumulative}")
+            lines.append(f"{_series(name + '_sum', labels)} {snapshot['sum']}")
+            lines.append(f"{_series(name + '_count', labels)} {snapshot['count']}")
+
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{_series(name, labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,127 @@
+import os
+import re
+import threading
+import time
+
+from icecream import ic
+
+from metrics import metrics
+
+_WORD = re.compile(r"\w+")
+
+
+class DeploymentHealth:
+    """Observed latency and error rate of one deployment, as exponentially weighted moving averages"""
+    SMOOTHING = 0.2
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.throttled_until = 0.0
+        self.requests = 0
+        self.updated = 0.0
+
+    def record(self, seconds: float = None, failed: bool = False) -> None:
+        self.requests += 1
+        self.updated = time.monotonic()
+        self.error_rate += self.SMOOTHING * ((1.0 if failed else 0.0) - self.error_rate)
+        if seconds is not None:
+            self.latency = seconds if self.latency is None else self.latency + self.SMOOTHING * (seconds - self.latency)
+
+
+class ModelRouter:
+    """
+    Picks the chat deployment of a question: simple questions with confidently matching documentation
+    go to the fast deployment (gpt-3.5-turbo), the others to the strong one (gpt-4).
+    A deployment that is throttled, slow or failing is moved behind the other one.
+    route() returns the deployments in the order they should be tried
+    """
+    # Top passage certainty from which the documentation is considered a direct match
+    CONFIDENT_CERTAINTY = float(os.getenv("ROUTER_CONFIDENT_CERTAINTY", 0.9))
+    COMPLEX_WORDS = int(os.getenv("ROUTER_COMPLEX_WORDS", 25))
+    # Time until the deployment answers (the first token when streaming) above which it counts as slow
+    SLOW_SECONDS = float(os.getenv("ROUTER_SLOW_SECONDS", 15))
+    MAX_ERROR_RATE = 0.5
+    THROTTLE_COOLDOWN = 30
+    # A deployment that was avoided for being slow or failing gets tried first again after this many seconds
+    RECOVERY_SECONDS = 60
+    COMPLEX_MARKERS = {
+        "why", "compare", "difference", "explain", "versus", "vs", "both", "either", "otherwise", "exception",
+        "warum", "weshalb", "unterschied", "vergleich", "erklär", "erkläre", "sowohl", "ausnahme",
+    }
+
+    def __init__(self, fast_deployment: str = None, strong_deployment: str = None):
+        self.fast_deployment = fast_deployment or os.getenv("GPT35_DEPLOYMENT_ID")
+        self.strong_deployment = strong_deployment or os.getenv("GPT4_DEPLOYMENT_ID")
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def _deployment_health(self, deployment: str) -> DeploymentHealth:
+        if deployment not in self._health:
+            self._health[deployment] = DeploymentHealth()
+        return self._health[deployment]
+
+    def is_complex(self, question: str) -> bool:
+        words = _WORD.findall(question.lower())
+        return len(words) > self.COMPLEX_WORDS or question.count("?") > 1 or any(word in self.COMPLEX_MARKERS for word in words)
+
+    def _problem(self, deployment: str):
+        """Why the deployment should not be tried first at the moment, None when it is healthy"""
+        with self._lock:
+            health = self._deployment_health(deployment)
+            now = time.monotonic()
+            if health.throttled_until > now:
+                return "throttled"
+            if now - health.updated > self.RECOVERY_SECONDS:
+                return None
+            if health.error_rate > self.MAX_ERROR_RATE:
+                return "failing"
+            if health.latency is not None and health.latency > self.SLOW_SECONDS:
+                return "slow"
+        return None
+
+    def route(self, question: str, certainty=None) -> list:
+        """Deployments to try for the question, best first; certainty is the one of the top passage"""
+        if not self.fast_deployment or self.fast_deployment == self.strong_deployment:
+            return [self.strong_deployment]
+
+        if self.is_complex(question):
+            order, reason = [self.strong_deployment, self.fast_deployment], "complex question"
+        elif certainty is None or certainty < self.CONFIDENT_CERTAINTY:
+            order, reason = [self.strong_deployment, self.fast_deployment], "no confident match"
+        else:
+            order, reason = [self.fast_deployment, self.strong_deployment], "simple question"
+
+        problem = self._problem(order[0])
+        if problem is not None and self._problem(order[1]) is None:
+            order.reverse()
+            reason = f"{reason}, {order[1]} is {problem}"
+
+        ic(f"Routing to {order[0]}: {reason} (certainty {certainty})")
+        metrics.inc("llm_route_total", deployment=order[0])
+        return order
+
+    def record_success(self, deployment: str, seconds: float) -> None:
+        with self._lock:
+            self._deployment_health(deployment).record(seconds)
+
+    def record_failure(self, deployment: str, throttled: bool = False) -> None:
+        with self._lock:
+            health = self._deployment_health(deployment)
+            health.record(failed=True)
+            if throttled:
+                health.throttled_until = time.monotonic() + self.THROTTLE_COOLDOWN
+        metrics.inc("llm_failures_total", deployment=deployment, throttled=str(throttled).lower())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                deployment: {
+                    'latency': health.latency,
+                    'error_rate': round(health.error_rate, 3),
+                    'throttled': health.throttled_until > now,
+                    'requests': health.requests,
+                }
+                for deployment, health in self._health.items()
+            }
@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+from adf_renderer import RENDERER_VERSION
+
+COLUMNS = ('article_id', 'title', 'version', 'last_edited', 'language', 'words', 'text')
+META_COLUMNS = COLUMNS[:-1]
+
+
+class PageStore:
+    """
+    Local store of the downloaded pages, one SQLite row per page indexed by article_id.
+    Pages can be listed without their texts and read one by one, writes are incremental and transactional.
+    Pages rendered by another renderer version do not count as stored, so their texts get rendered again
+    """
+    LOCATION = os.getenv("PAGE_STORE_LOCATION", 'pages.db')
+    # Generations of published article changes that are kept for readers that are behind
+    CHANGES_KEPT = 100
+
+    def __init__(self, location: str = None, revision: int = RENDERER_VERSION):
+        self.location = location or self.LOCATION
+        self.revision = revision
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    article_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    version INTEGER,
+                    last_edited TEXT,
+                    language TEXT,
+                    words INTEGER,
+                    text TEXT,
+                    revision INTEGER
+                )
+            """)
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS changes (generation INTEGER, article_id TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS changes_generation ON changes (generation)")
+
+    @contextmanager
+    def _connect(self):
+        """A connection per call, so the store can be used from any thread; commits on success"""
+        with closing(sqlite3.connect(self.location, timeout=30)) as connection:
+            connection.row_factory = sqlite3.Row
+            with connection:
+                yield connection
+
+    # Reading
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM pages WHERE revision = ?", (self.revision,)).fetchone()[0]
+
+    def versions(self) -> dict:
+        """{article_id: version number} of the stored pages"""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT article_id, version FROM pages WHERE revision = ?", (self.revision,))
+            return {row['article_id']: row['version'] for row in rows}
+
+    def get(self, article_id: str):
+        """The stored page, None if it is not stored"""
+        pages = self.get_many([article_id])
+        return pages[0] if pages else None
+
+    def get_many(self, article_ids: list) -> list:
+        """The stored pages among the given ids"""
+        pages = []
+        with self._connect() as connection:
+            # Chunked to stay below SQLite's limit of bound parameters
+            for start in range(0, len(article_ids), 500):
+                ids = article_ids[start:start + 500]
+                rows = connection.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM pages WHERE revision = ? AND article_id IN ({', '.join('?' * len(ids))})",
+                    (self.revision, *ids)
+                )
+                pages.extend(self._page(row) for row in rows)
+        return pages
+
+    def iter_pages(self, with_text: bool = True):
+        """Lazily iterate over the stored pages, only their metadata unless with_text"""
+        columns = COLUMNS if with_text else META_COLUMNS
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT {', '.join(columns)} FROM pages WHERE revision = ? ORDER BY article_id", (self.revision,)
+            )
+            for row in rows:
+                yield self._page(row)
+
+    def pages(self):
+        """All stored pages, None if nothing is stored yet"""
+        return list(self.iter_pages()) or None
+
+    def updated_at(self):
+        """Unix time of the last write that changed the store, None before the first one"""
+        return self._timestamp('updated_at')
+
+    def synced_at(self):
+        """Unix time the store was last brought in line with the whole space, None before the first time"""
+        return self._timestamp('synced_at')
+
+    def _timestamp(self, key: str):
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return float(row['value']) if row else None
+
+    def changes_since(self, generation) -> tuple:
+        """
+        (latest generation, ids of the articles changed after the given generation), see publish_changes().
+        The ids are None when all articles changed or the log does not reach back to the generation any more;
+        nothing changed since None
+        """
+        with self._connect() as connection:
+            latest = self._generation(connection)
+            if generation is None or generation == latest:
+                return latest, []
+            oldest = connection.execute("SELECT MIN(generation) FROM changes").fetchone()[0]
+            # A generation ahead of the store means the store was recreated
+            if generation > latest or oldest is None or generation < oldest - 1:
+                return latest, None
+            rows = connection.execute("SELECT DISTINCT article_id FROM changes WHERE generation > ?", (generation,))
+            article_ids = [row['article_id'] for row in rows]
+            return latest, None if None in article_ids else article_ids
+
+    @staticmethod
+    def _generation(connection) -> int:
+        return connection.execute("SELECT COALESCE(MAX(generation), 0) FROM changes").fetchone()[0]
+
+    @staticmethod
+    def _page(row) -> dict:
+        page = dict(row)
+        if page.get('language') is None:
+            page.pop('language')
+        return page
+
+    # Writing
+
+    def upsert(self, pages: list) -> int:
+        """Insert new pages and update the ones that changed; returns the number of rows written"""
+        with self._connect() as connection:
+            written = self._upsert(connection, pages)
+            if written:
+                self._touch(connection)
+        return written
+
+    def delete(self, article_ids: list) -> int:
+        with self._connect() as connection:
+            deleted = self._delete(connection, article_ids)
+            if deleted:
+                self._touch(connection)
+        return deleted
+
+    def replace(self, pages: list) -> dict:
+        """Make the given pages the content of the store, in one transaction"""
+        current = {page['article_id'] for page in pages}
+        with self._connect() as connection:
+            stored = [row['article_id'] for row in connection.execute("SELECT article_id FROM pages")]
+            written = self._upsert(connection, pages)
+            deleted = self._delete(connection, [article_id for article_id in stored if article_id not in current])
+            if written or deleted:
+                self._touch(connection)
+            self._touch(connection, 'synced_at')
+        return {'written': written, 'deleted': deleted}
+
+    def _upsert(self, connection, pages: list) -> int:
+        # Rows are only rewritten when something in them changed
+        changes = connection.total_changes
+        connection.executemany(
+            f"""
+            INSERT INTO pages ({', '.join(COLUMNS)}, revision) VALUES ({', '.join('?' * len(COLUMNS))}, ?)
+            ON CONFLICT(article_id) DO UPDATE SET
+                {', '.join(f'{column} = excluded.{column}' for column in COLUMNS[1:])}, revision = excluded.revision
+            WHERE {' OR '.join(f'{column} IS NOT excluded.{column}' for column in COLUMNS[1:])}
+                OR revision IS NOT excluded.revision
+            """,
+            [tuple(page.get(column) for column in COLUMNS) + (self.revision,) for page in pages]
+        )
+        return connection.total_changes - changes
+
+    @staticmethod
+    def _delete(connection, article_ids: list) -> int:
+        changes = connection.total_changes
+        connection.executemany("DELETE FROM pages WHERE article_id = ?", [(article_id,) for article_id in article_ids])
+        return connection.total_changes - changes
+
+    def publish_changes(self, article_ids: list, everything: bool = False) -> int:
+        """
+        Record that the indexed content of the articles changed, as a new generation, and return the generation.
+        everything: the change concerns all articles, e.g. new articles can answer any question.
+        Every process reading the store finds the changes with changes_since()
+        """
+        with self._connect() as connection:
+            generation = self._generation(connection)
+            if not article_ids and not everything:
+                return generation
+            generation += 1
+            # A NULL article id stands for all articles
+            connection.executemany(
+                "INSERT INTO changes (generation, article_id) VALUES (?, ?)",
+                [(generation, article_id) for article_id in article_ids] + ([(generation, None)] if everything else [])
+            )
+            connection.execute("DELETE FROM changes WHERE generation <= ?", (generation - self.CHANGES_KEPT,))
+        return generation
+
+    def mark_synced(self) -> None:
+        with self._connect() as connection:
+            self._touch(connection, 'synced_at')
+
+    @staticmethod
+    def _touch(connection, key: str = 'updated_at') -> None:
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(time.time())))
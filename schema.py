@@ -49,6 +49,17 @@ article_class = {
                 }
             }
         },
+        {
+            "name": "content_hash",
+            "description": "Fingerprint of the stored article content, used by the delta sync",
+            "dataType": ["text"],
+            "moduleConfig": {
+                "text2vec-openai": {
+                    "skip": True,
+                    "vectorizePropertyName": False
+                }
+            }
+        },
         {
             "name": "last_edited",
             "description": "Date when the article was last changed",
@@ -82,4 +93,95 @@ article_class = {
             "model": "gpt-3.5-turbo"
         }
     },
-}
\ No newline at end of file
+}
+
+passage_class = {
+    # Class definition
+    "class": "Passage",
+    "description": "Overlapping passage of an article, the unit of retrieval",
+
+    # Property definitions
+    "properties": [
+        {
+            "name": "title",
+            "description": "The title of the article the passage belongs to",
+            "dataType": ["text"],
+            "moduleConfig": {
+                "text2vec-openai": {
+                    "skip": False,
+                    "vectorizePropertyName": False
+                }
+            }
+        },
+        {
+            "name": "text",
+            "description": "Markdown text content of the passage",
+            "dataType": ["text"],
+            "moduleConfig": {
+                "text2vec-openai": {
+                    "skip": False,
+                    "vectorizePropertyName": False
+                }
+            }
+        },
+        {
+            "name": "language",
+            "description": "Language of the text",
+            "dataType": ["text"],
+            "moduleConfig": {
+                "text2vec-openai": {
+                    "skip": True,
+                    "vectorizePropertyName": False
+                }
+            }
+        },
+        {
+            "name": "article_id",
+            "description": "Confluence article id of the article the passage belongs to",
+            "dataType": ["text"],
+            "moduleConfig": {
+                "text2vec-openai": {
+                    "skip": True,
+                    "vectorizePropertyName": False
+                }
+            }
+        },
+        {
+            "name": "chunk_id",
+            "description": "Identity of the passage: article id and position",
+            "dataType": ["text"],
+            "moduleConfig": {
+                "text2vec-openai": {
+                    "skip": True,
+                    "vectorizePropertyName": False
+                }
+            }
+        },
+        {
+            "name": "position",
+            "description": "Position of the passage in the article",
+            "dataType": ["int"],
+            "moduleConfig": {
+                "text2vec-openai": {
+                    "skip": True,
+                    "vectorizePropertyName": False
+                }
+            }
+        },
+    ],
+
+    # Specify a vectorizer
+    "vectorizer": "text2vec-openai",
+
+    # Module settings
+    "moduleConfig": {
+        "text2vec-openai": {
+            "vectorizeClassName": False,
+            "model": "ada",
+            "modelVersion": "002",
+            "type": "text",
+            "resourceName": "student-chatbot",
+            "deploymentId": "embeddings",
+        },
+    },
+}
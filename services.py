@@ -0,0 +1,48 @@
+import threading
+
+from dotenv import load_dotenv
+
+# The app modules read their settings when they are imported, the entry points import this module first
+load_dotenv()
+
+from icecream import ic  # noqa: E402
+
+from articles_operator import ArticlesOperator  # noqa: E402
+
+# Shared by the Flask app, the Slack bot and the background jobs of the process
+_operator = None
+_lock = threading.Lock()
+_ready = threading.Event()
+
+
+def get_operator() -> ArticlesOperator:
+    """The ArticlesOperator of the process, created on first use"""
+    global _operator
+    if _operator is None:
+        with _lock:
+            if _operator is None:
+                _operator = ArticlesOperator()
+    return _operator
+
+
+def warm_up() -> bool:
+    """Create the shared clients and check that Weaviate answers. Never raises, returns the readiness"""
+    try:
+        ready = get_operator()._client.is_ready()
+    except Exception as e:
+        ic(f'Warm up failed: {e!r}')
+        ready = False
+
+    if ready:
+        _ready.set()
+    ic(f'Services ready: {ready}')
+    return ready
+
+
+def is_ready() -> bool:
+    return _ready.is_set() or warm_up()
+
+
+def warm_up_in_background() -> None:
+    """Warm up without delaying the start of the process"""
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
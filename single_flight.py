@@ -0,0 +1,128 @@
+import threading
+from concurrent.futures import Future
+
+
+class _Stream:
+    """Items generated by the leader of a streamed call, replayed to every follower"""
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.condition = threading.Condition()
+
+    def append(self, item) -> None:
+        with self.condition:
+            self.items.append(item)
+            self.condition.notify_all()
+
+    def finish(self, error: BaseException = None) -> None:
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def follow(self):
+        """The items generated so far at once, then the next ones as they come"""
+        idx = 0
+        while True:
+            with self.condition:
+                while idx == len(self.items) and not self.done:
+                    self.condition.wait()
+                items = self.items[idx:]
+                done, error = self.done, self.error
+            idx += len(items)
+            yield from items
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key:
+    the first caller computes the result, callers arriving while it runs wait for it and share it
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.counters = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.counters['executed'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stream(self, key, fn):
+        """
+        Same as do() for a generator function: the first caller iterates fn() and yields its items,
+        callers arriving meanwhile get the items generated so far at once and then the next ones as they come
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            leader = call is None
+            if leader:
+                call = self._streams[key] = _Stream()
+                self.counters['executed'] += 1
+            else:
+                call.followers += 1
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            yield from call.follow()
+            return
+
+        try:
+            items = fn()
+            for item in items:
+                call.append(item)
+                yield item
+        except GeneratorExit:
+            # The caller of the leader stopped reading, the followers still get all the items
+            if self._release(key).followers:
+                self._drain(call, items)
+            raise
+        except BaseException as e:
+            self._release(key).finish(e)
+            raise
+        else:
+            self._release(key).finish()
+
+    def _release(self, key) -> _Stream:
+        """Stop coalescing new callers into the streamed call of the key"""
+        with self._lock:
+            return self._streams.pop(key)
+
+    @staticmethod
+    def _drain(call: _Stream, items) -> None:
+        try:
+            for item in items:
+                call.append(item)
+        except Exception as e:
+            call.finish(e)
+        else:
+            call.finish()
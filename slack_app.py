@@ -1,12 +1,27 @@
+from services import get_operator
 import os
-from dotenv import load_dotenv
+import threading
+import time
+from collections import OrderedDict
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from icecream import ic
-from articles_operator import ArticlesOperator
+from metrics import metrics
+from bounded_executor import BoundedExecutor, KeyLimitReached, QueueFull
 
 
 class SlackBotFacade:
+    STREAM_ANSWERS = os.getenv("SLACK_STREAM_ANSWERS", "1") == "1"
+    # Minimal interval between two edits of the answer message, Slack rate limits chat.update
+    UPDATE_INTERVAL = float(os.getenv("SLACK_UPDATE_INTERVAL", 1.0))
+    WORKERS = int(os.getenv("SLACK_WORKERS", 4))
+    QUEUE_DEPTH = int(os.getenv("SLACK_QUEUE_DEPTH", 20))
+    PER_USER_LIMIT = int(os.getenv("SLACK_PER_USER_LIMIT", 1))
+    # Slack re-delivers events that were not handled in time, ids seen within this many seconds are skipped
+    DEDUPE_TTL = 600
+    BUSY_REPLY = "I'm answering a lot of questions right now, please ask again in a minute 🙏"
+    USER_BUSY_REPLY = "I'm still working on your previous question, please wait for the answer 🙏"
+
     def __init__(self):
         ic(os.environ.get("SLACK_SIGNING_SECRET"))
 
@@ -14,20 +29,82 @@ class SlackBotFacade:
             token=os.environ.get("SLACK_BOT_TOKEN"),
             signing_secret=os.environ.get("SLACK_SIGNING_SECRET")
         )
-        self.operator = ArticlesOperator()
+        self.operator = get_operator()
+        self.executor = BoundedExecutor(self.WORKERS, self.QUEUE_DEPTH, self.PER_USER_LIMIT, name="slack-answer")
+        self._seen_events = OrderedDict()
+        self._seen_lock = threading.Lock()
 
     def start(self):
         @self.app.event("message")
-        def message_hello(message, say):
+        def message_hello(message, body, say):
+            # Edits of the bot's own answers and other message subtypes are no questions
+            if message.get('subtype') or message.get('bot_id'):
+                return
+            if not self._first_delivery(message.get('client_msg_id') or body.get('event_id')):
+                ic('Skipping a re-delivered event')
+                return
+
             message_text = self.extract_text_from_blocks(message)
+            if not message_text.strip():
+                return
             ic(message_text)
-            ic(say("Searching for the answer... 🔎"))
 
-            answer = self.operator.ask_question(message_text, verbore=True)
-            say(answer)
+            # The listener returns at once, the answer is produced by one of the workers
+            try:
+                self.executor.submit(message.get('user'), self.answer, message_text, say)
+            except QueueFull:
+                say(self.BUSY_REPLY)
+            except KeyLimitReached:
+                say(self.USER_BUSY_REPLY)
 
         SocketModeHandler(self.app, os.environ["SLACK_APP_TOKEN"]).start()
 
+    def _first_delivery(self, event_key) -> bool:
+        """False for an event key that was already seen within DEDUPE_TTL"""
+        if event_key is None:
+            return True
+
+        now = time.monotonic()
+        with self._seen_lock:
+            while self._seen_events and next(iter(self._seen_events.values())) < now - self.DEDUPE_TTL:
+                self._seen_events.popitem(last=False)
+            if event_key in self._seen_events:
+                return False
+            self._seen_events[event_key] = now
+            return True
+
+    def answer(self, message_text: str, say) -> None:
+        with metrics.span('slack_post'):
+            placeholder = ic(say("Searching for the answer... 🔎"))
+        try:
+            if self.STREAM_ANSWERS:
+                self.stream_answer(message_text, placeholder['channel'], placeholder['ts'])
+                return
+
+            answer = self.operator.ask_question(message_text, verbose=True)
+            with metrics.span('slack_post'):
+                say(answer)
+        except Exception as e:
+            ic(f'Failed to answer the question: {e!r}')
+            self.app.client.chat_update(
+                channel=placeholder['channel'], ts=placeholder['ts'],
+                text="Sorry, something went wrong while searching for the answer 😕"
+            )
+
+    def stream_answer(self, question: str, channel: str, ts: str) -> None:
+        """Edit the placeholder message with the answer as it is generated, at most once per UPDATE_INTERVAL"""
+        answer = ""
+        last_update = time.monotonic()
+        for delta in self.operator.ask_question_stream(question):
+            answer += delta
+            if time.monotonic() - last_update >= self.UPDATE_INTERVAL:
+                with metrics.span('slack_post'):
+                    self.app.client.chat_update(channel=channel, ts=ts, text=answer)
+                last_update = time.monotonic()
+
+        with metrics.span('slack_post'):
+            self.app.client.chat_update(channel=channel, ts=ts, text=answer)
+
     def extract_text_from_blocks(self, data):
         """
         Extracts plain text from the given data structure.
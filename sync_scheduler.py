@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import schedule
+import sentry_sdk
+from icecream import ic
+from sentry_sdk.crons import monitor
+
+from services import get_operator
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+
+class SyncAlreadyRunning(Exception):
+    """Raised when a sync is triggered while another one is running"""
+
+
+class SyncScheduler:
+    """
+    Runs the Confluence to Weaviate sync in the background: nightly and on demand.
+    Only one sync runs at a time, also across the worker processes of the host (lock file).
+    The status of the last run is persisted, so every worker can report it
+    """
+    STATUS_LOCATION = 'sync_status.json'
+    LOCK_LOCATION = 'sync.lock'
+    MONITOR_SLUG = os.getenv("SENTRY_SYNC_MONITOR", "confluence-sync")
+    SYNC_AT = os.getenv("SYNC_AT", "02:00")
+    POLL_INTERVAL = 30
+
+    def __init__(self, operator_factory=get_operator):
+        self._operator_factory = operator_factory
+        self._lock = threading.Lock()
+        self._scheduler = schedule.Scheduler()
+        self._started = False
+        self._job_id = None
+
+    # Status
+
+    def status(self) -> dict:
+        try:
+            with open(self.STATUS_LOCATION, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'state': 'idle'}
+
+    def _save_status(self, status: dict) -> None:
+        tmp_location = f'{self.STATUS_LOCATION}.{os.getpid()}.tmp'
+        with open(tmp_location, 'w') as file:
+            json.dump(status, file)
+        os.replace(tmp_location, self.STATUS_LOCATION)
+
+    # Running
+
+    def trigger(self) -> str:
+        """Start a sync in a background thread and return its job id"""
+        lock_file = self._acquire()
+        job_id = self._job_id = uuid.uuid4().hex
+        threading.Thread(target=self._run_locked, args=(job_id, lock_file), name=f"sync-{job_id}", daemon=True).start()
+        return job_id
+
+    def run(self, job_id: str = None) -> dict:
+        """Run a sync in the calling thread"""
+        lock_file = self._acquire()
+        self._job_id = job_id or uuid.uuid4().hex
+        return self._run_locked(self._job_id, lock_file)
+
+    def _acquire(self):
+        """
+        Take the in-process lock and the lock file, returning the open lock file.
+        Raises SyncAlreadyRunning with the id of the running job when this or another process is syncing
+        """
+        if not self._lock.acquire(blocking=False):
+            raise SyncAlreadyRunning(self._job_id)
+
+        lock_file = open(self.LOCK_LOCATION, 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                self._lock.release()
+                raise SyncAlreadyRunning(self.status().get('job_id'))
+        return lock_file
+
+    def _run_locked(self, job_id: str, lock_file) -> dict:
+        """Run the sync while holding the locks taken by _acquire(), which are released at the end"""
+        try:
+            return self._sync(job_id)
+        finally:
+            # Closing the file releases the flock
+            lock_file.close()
+            self._lock.release()
+
+    def _sync(self, job_id: str) -> dict:
+        started = time.monotonic()
+        status = {
+            'job_id': job_id,
+            'state': 'running',
+            'phase': 'starting',
+            'counters': {},
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'last_duration': self.status().get('last_duration'),
+        }
+        self._save_status(status)
+
+        def on_progress(phase, counters):
+            status['phase'] = phase
+            status['counters'].update(counters)
+            self._save_status(status)
+
+        operator = None
+        try:
+            with monitor(monitor_slug=self.MONITOR_SLUG):
+                operator = self._operator_factory()
+                operator.on_progress = on_progress
+                operator.load_pages()
+                operator.upload()
+            status['state'] = 'succeeded'
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            status['state'] = 'failed'
+            status['error'] = repr(e)
+        finally:
+            if operator is not None:
+                operator.on_progress = None
+            status['phase'] = 'done'
+            status['finished_at'] = datetime.now(timezone.utc).isoformat()
+            status['last_duration'] = round(time.monotonic() - started, 1)
+            self._save_status(status)
+
+        ic(f"Sync {job_id} {status['state']} in {status['last_duration']}s")
+        return status
+
+    # Schedule
+
+    def _trigger_scheduled(self) -> None:
+        try:
+            self.trigger()
+        except SyncAlreadyRunning:
+            ic('Scheduled sync skipped, a sync is already running')
+
+    def start(self) -> None:
+        """Run the sync every day at SYNC_AT (local time of the host), from a background thread"""
+        if self._started:
+            return
+        self._started = True
+        self._scheduler.every().day.at(self.SYNC_AT).do(self._trigger_scheduled)
+
+        def loop():
+            while True:
+                self._scheduler.run_pending()
+                time.sleep(self.POLL_INTERVAL)
+
+        threading.Thread(target=loop, name="sync-scheduler", daemon=True).start()
@@ -0,0 +1,107 @@
+import json
+import random
+
+import pytest
+
+from adf_renderer import AdfTextCache, render_adf
+
+
+def reference_render(node, is_root=True) -> str:
+    """The former recursive converter, with the heading markers added since"""
+    node_type = node.get("type", "")
+    children = node.get("content", [])
+
+    if node_type == "text":
+        text = node.get("text", "")
+        for mark in node.get("marks", []):
+            if mark.get("type", "") == "link":
+                text = f"{text} <{mark.get('attrs', {}).get('url', '')}>"
+        return text
+    if node_type == "listItem":
+        return "".join(reference_render(child, is_root=False) for child in children) + "\n"
+    if node_type == "codeBlock":
+        return f"```\n{''.join(reference_render(child, is_root=False) for child in children)}\n```\n"
+    if node_type == "bulletList":
+        return "\n".join(f"- {reference_render(child, is_root=False)}" for child in children)
+    if node_type == "heading":
+        text = "".join(reference_render(child, is_root=False) for child in children).strip()
+        return "#" * node.get("attrs", {}).get("level", 1) + " " + text if text else ""
+
+    separator = "\n" if is_root else ""
+    return separator.join(reference_render(child, is_root=False) for child in children).strip()
+
+
+TYPES = ["paragraph", "listItem", "codeBlock", "heading", "bulletList", "panel", "table"]
+TEXTS = ["", " ", "\n", "zoom", " absence ", "moodle\n", "  laptop  password "]
+
+
+def random_node(rng, depth: int) -> dict:
+    if depth == 0 or rng.random() < 0.3:
+        node = {"type": "text", "text": rng.choice(TEXTS)}
+        if rng.random() < 0.2:
+            node["marks"] = [{"type": rng.choice(["link", "strong"]), "attrs": {"url": "https://example.com"}}]
+        return node
+    node = {"type": rng.choice(TYPES), "content": [random_node(rng, depth - 1) for _ in range(rng.randint(0, 4))]}
+    if node["type"] == "heading" and rng.random() < 0.8:
+        node["attrs"] = {"level": rng.randint(1, 6)}
+    return node
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_output_matches_the_recursive_converter_on_random_documents(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        document = {"type": "doc", "content": [random_node(rng, 5) for _ in range(rng.randint(0, 6))]}
+
+        assert render_adf(document) == reference_render(document), json.dumps(document)
+
+
+def test_blocks_lists_code_and_links():
+    document = {"type": "doc", "content": [
+        {"type": "heading", "attrs": {"level": 2}, "content": [{"type": "text", "text": "Zoom "}]},
+        {"type": "paragraph", "content": [
+            {"type": "text", "text": "See "},
+            {"type": "text", "text": "the FAQ", "marks": [{"type": "link", "attrs": {"url": "https://faq"}}]},
+        ]},
+        {"type": "bulletList", "content": [
+            {"type": "listItem", "content": [{"type": "paragraph", "content": [{"type": "text", "text": "one"}]}]},
+            {"type": "listItem", "content": [{"type": "paragraph", "content": [{"type": "text", "text": "two"}]}]},
+        ]},
+        {"type": "codeBlock", "content": [{"type": "text", "text": "restart"}]},
+    ]}
+
+    assert render_adf(document) == "## Zoom\nSee the FAQ <https://faq>\n- one\n\n- two\n\n```\nrestart\n```"
+
+
+def test_documents_nested_deeper_than_the_recursion_limit():
+    node = {"type": "text", "text": "deep"}
+    for _ in range(5000):
+        node = {"type": "paragraph", "content": [node]}
+
+    assert render_adf({"type": "doc", "content": [node]}) == "deep"
+
+
+def paragraph_json(text: str) -> str:
+    return json.dumps({"type": "doc", "content": [{"type": "paragraph", "content": [{"type": "text", "text": text}]}]})
+
+
+def test_cache_renders_each_page_version_once():
+    cache = AdfTextCache()
+
+    assert cache.render("1", 1, paragraph_json("first")) == "first"
+    # Same version: the cached text, the document is not parsed again
+    assert cache.render("1", 1, "not json") == "first"
+    assert cache.render("1", 2, paragraph_json("second")) == "second"
+
+
+def test_cache_evicts_the_least_recently_used_page():
+    cache = AdfTextCache(maxsize=2)
+    cache.render("1", 1, paragraph_json("one"))
+    cache.render("2", 1, paragraph_json("two"))
+    cache.render("1", 1, "not json")
+
+    cache.render("3", 1, paragraph_json("three"))
+
+    assert cache.render("1", 1, "not json") == "one"
+    with pytest.raises(json.JSONDecodeError):
+        cache.render("2", 1, "not json")
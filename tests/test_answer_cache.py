@@ -0,0 +1,68 @@
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(maxsize=2, ttl=60, similarity=0.9)
+
+
+def test_questions_are_matched_after_normalization(cache):
+    cache.put('How do I reset my password?', 'Like this', ['1'])
+
+    assert cache.get('how do i  reset my PASSWORD') == 'Like this'
+    assert cache.get('How do I change my password?') is None
+
+
+def test_expired_answers_are_misses(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, 'monotonic', lambda: now[0])
+    cache.put('question', 'answer', ['1'], vector=[1, 0])
+
+    now[0] += 61
+
+    assert cache.get('question') is None
+    assert cache.get_similar([1, 0]) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_answer_is_evicted(cache):
+    cache.put('first', 'a', ['1'])
+    cache.put('second', 'b', ['2'])
+    cache.get('first')
+
+    cache.put('third', 'c', ['3'])
+
+    assert cache.get('second') is None
+    assert cache.get('first') == 'a' and cache.get('third') == 'c'
+
+
+def test_similar_questions_share_the_answer(cache):
+    cache.put('question', 'answer', ['1'], vector=[1, 0])
+
+    assert cache.get_similar([10, 1]) == 'answer'
+    assert cache.get_similar([1, 1]) is None
+    assert cache.get_similar(None) is None
+    assert cache.stats()['similar_hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_answers_of_changed_articles_are_dropped(cache):
+    cache.put('first', 'a', ['1', '2'])
+    cache.put('second', 'b', ['3'])
+
+    cache.invalidate_articles(['2'])
+
+    assert cache.get('first') is None
+    assert cache.get('second') == 'b'
+    assert cache.stats()['invalidated'] == 1
+
+
+def test_clear_drops_every_answer(cache):
+    cache.put('first', 'a', ['1'])
+    cache.put('second', 'b', [])
+
+    cache.clear()
+
+    assert cache.stats() == {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'invalidated': 2, 'size': 0}
@@ -0,0 +1,81 @@
+import threading
+
+from batch_importer import BatchImporter
+
+
+def objects(count: int) -> list:
+    return [{'id': str(idx)} for idx in range(count)]
+
+
+def test_every_object_is_imported_once():
+    sent = []
+    lock = threading.Lock()
+
+    def send_batch(batch):
+        with lock:
+            sent.extend(obj['id'] for obj in batch)
+        return [None] * len(batch)
+
+    summary = BatchImporter(send_batch, batch_size=10, workers=3).import_objects(objects(95))
+
+    assert summary['imported'] == 95 and summary['failed'] == []
+    assert sorted(sent, key=int) == [str(idx) for idx in range(95)]
+
+
+def test_rejected_objects_are_retried_on_their_own():
+    attempts = {}
+    lock = threading.Lock()
+
+    def send_batch(batch):
+        with lock:
+            for obj in batch:
+                attempts[obj['id']] = attempts.get(obj['id'], 0) + 1
+            # Object 3 is rejected the first time only, object 7 every time
+            return [
+                'rejected' if obj['id'] == '7' or (obj['id'] == '3' and attempts['3'] == 1) else None
+                for obj in batch
+            ]
+
+    summary = BatchImporter(send_batch, batch_size=10, workers=1, max_retries=2).import_objects(objects(10))
+
+    assert summary['imported'] == 9
+    assert summary['failed'] == [{'id': '7', 'error': 'rejected'}]
+    assert attempts['3'] == 2 and attempts['7'] == 3 and attempts['0'] == 1
+
+
+def test_a_failed_request_fails_every_object_of_the_batch():
+    def send_batch(batch):
+        raise ConnectionError('down')
+
+    summary = BatchImporter(send_batch, batch_size=10, workers=1, max_retries=0).import_objects(objects(3))
+
+    assert summary['imported'] == 0
+    assert [failure['id'] for failure in summary['failed']] == ['0', '1', '2']
+    assert 'down' in summary['failed'][0]['error']
+
+
+def test_batch_size_grows_while_fast_and_halves_when_slow_or_failing():
+    importer = BatchImporter(lambda batch: [None] * len(batch), batch_size=100, target_latency=2.0)
+
+    importer._adapt(latency=0.5, error_rate=0)
+    assert importer.batch_size == 150
+
+    importer._adapt(latency=1.5, error_rate=0)
+    assert importer.batch_size == 150
+
+    importer._adapt(latency=3.0, error_rate=0)
+    assert importer.batch_size == 75
+
+    importer._adapt(latency=0.5, error_rate=0.5)
+    assert importer.batch_size == 37
+
+
+def test_batch_size_stays_within_bounds():
+    importer = BatchImporter(lambda batch: [None] * len(batch), batch_size=BatchImporter.MIN_BATCH_SIZE)
+
+    importer._adapt(latency=10.0, error_rate=1.0)
+    assert importer.batch_size == BatchImporter.MIN_BATCH_SIZE
+
+    importer.batch_size = BatchImporter.MAX_BATCH_SIZE
+    importer._adapt(latency=0.0, error_rate=0)
+    assert importer.batch_size == BatchImporter.MAX_BATCH_SIZE
@@ -0,0 +1,65 @@
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from chunking import chunk_page
+
+
+def passage(article_id: str, position: int = 0, **fields) -> dict:
+    return {'article_id': article_id, 'position': position, **fields}
+
+
+def keys(passages: list) -> list:
+    return [(item['article_id'], item['position']) for item in passages]
+
+
+def page(article_id: str, title: str, text: str) -> dict:
+    return {'article_id': article_id, 'title': title, 'language': 'en', 'text': text}
+
+
+def test_fusion_ranks_passages_found_by_both_searches_first():
+    vector = [passage('a'), passage('b'), passage('c')]
+    keyword = [passage('d'), passage('a'), passage('c')]
+
+    fused = reciprocal_rank_fusion([vector, keyword], limit=4)
+
+    assert keys(fused) == [('a', 0), ('c', 0), ('d', 0), ('b', 0)]
+
+
+def test_fusion_keeps_the_limit():
+    assert len(reciprocal_rank_fusion([[passage(str(idx)) for idx in range(10)]], limit=3)) == 3
+
+
+def test_fusion_tells_passages_of_one_article_apart():
+    fused = reciprocal_rank_fusion([[passage('a', 0), passage('a', 1)]], limit=5)
+
+    assert keys(fused) == [('a', 0), ('a', 1)]
+
+
+def test_fusion_keeps_the_first_version_of_a_passage():
+    vector = [passage('a', certainty=0.9)]
+    keyword = [passage('a', score=3.0)]
+
+    fused = reciprocal_rank_fusion([vector, keyword], limit=1)
+
+    assert fused == [passage('a', certainty=0.9)]
+
+
+def test_search_ranks_matching_passages():
+    index = BM25Index()
+    index.sync_pages([
+        page('1', 'Zoom', 'How to fix the microphone in zoom'),
+        page('2', 'Internship', 'Register your internship with the job agent'),
+    ], chunk_page)
+
+    assert [hit['article_id'] for hit in index.search('zoom microphone')] == ['1']
+
+
+def test_sync_reindexes_changed_and_removes_deleted_articles_only():
+    index = BM25Index()
+    zoom, internship = page('1', 'Zoom', 'Fix zoom'), page('2', 'Internship', 'Register the internship')
+    index.sync_pages([zoom, internship], chunk_page)
+
+    counts = index.sync_pages([page('1', 'Zoom', 'Fix the camera')], chunk_page)
+
+    assert counts == {'indexed': 1, 'removed': 1}
+    assert index.search('internship') == []
+    assert [hit['article_id'] for hit in index.search('camera')] == ['1']
+    assert index.sync_pages([page('1', 'Zoom', 'Fix the camera')], chunk_page) == {'indexed': 0, 'removed': 0}
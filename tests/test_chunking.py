@@ -0,0 +1,79 @@
+from chunking import MIN_CHUNK_WORDS, chunk_page, chunk_text
+
+
+def words(count: int, prefix: str = "w") -> str:
+    return " ".join(f"{prefix}{idx}" for idx in range(count))
+
+
+def test_empty_text_has_no_passages():
+    assert chunk_text("") == []
+
+
+def test_short_text_is_one_passage():
+    assert chunk_text("How to report an absence") == ["How to report an absence"]
+
+
+def test_passages_stay_within_max_words_plus_overlap():
+    text = "\n".join(words(30, f"p{paragraph}_") for paragraph in range(10))
+
+    passages = chunk_text(text, max_words=100, overlap_words=10)
+
+    assert len(passages) > 1
+    assert all(len(passage.split()) <= 110 for passage in passages)
+
+
+def test_next_passage_repeats_the_tail_of_the_previous_one():
+    text = "\n".join(words(40, f"p{paragraph}_") for paragraph in range(3))
+
+    first, second = chunk_text(text, max_words=80, overlap_words=5)
+
+    assert second.split()[:5] == first.split()[-5:]
+
+
+def test_continued_section_repeats_its_heading():
+    text = "# Absence\n" + "\n".join(words(40, f"p{paragraph}_") for paragraph in range(3))
+
+    passages = chunk_text(text, max_words=80, overlap_words=0)
+
+    assert len(passages) == 2
+    assert all(passage.startswith("# Absence\n") for passage in passages)
+
+
+def test_heading_starts_a_passage_once_the_current_one_is_long_enough():
+    text = f"# First\n{words(MIN_CHUNK_WORDS, 'a')}\n# Second\n{words(10, 'b')}"
+
+    passages = chunk_text(text, max_words=200, overlap_words=10)
+
+    assert passages == [f"# First\n{words(MIN_CHUNK_WORDS, 'a')}", f"# Second\n{words(10, 'b')}"]
+
+
+def test_short_sections_share_a_passage():
+    text = f"# First\n{words(10, 'a')}\n# Second\n{words(10, 'b')}"
+
+    assert chunk_text(text) == [text]
+
+
+def test_list_is_not_split_from_its_items():
+    items = "\n".join(f"- item {idx}" for idx in range(5))
+    text = f"{words(45)}\n{items}"
+
+    passages = chunk_text(text, max_words=50, overlap_words=0)
+
+    assert passages == [words(45), items]
+
+
+def test_long_paragraph_is_split_at_sentence_boundaries():
+    text = " ".join(f"s{idx}." for idx in range(30))
+
+    passages = chunk_text(text, max_words=10, overlap_words=0)
+
+    assert passages == [" ".join(f"s{idx}." for idx in range(start, start + 10)) for start in (0, 10, 20)]
+
+
+def test_chunk_page_links_passages_to_the_article():
+    page = {'article_id': '42', 'title': 'Zoom', 'language': 'en', 'text': words(30)}
+
+    passages = chunk_page(page, max_words=20, overlap_words=0)
+
+    assert [passage['chunk_id'] for passage in passages] == ['42-0', '42-1']
+    assert all(passage['article_id'] == '42' and passage['language'] == 'en' for passage in passages)
@@ -0,0 +1,44 @@
+import pytest
+
+from confidence_gate import ConfidenceGate
+
+
+def passage(certainty=None) -> dict:
+    return {'article_id': '1', '_additional': {'certainty': certainty}}
+
+
+@pytest.fixture
+def gate():
+    return ConfidenceGate(min_certainty=0.8, min_question_chars=4)
+
+
+@pytest.mark.parametrize('question', ['Hi!', 'thank you', 'Danke schön', 'ok?', 'a b'])
+def test_small_talk_gets_the_template(gate, question):
+    assert gate.check_question(question) == ConfidenceGate.SMALL_TALK_REPLY
+
+
+@pytest.mark.parametrize('question', ['How do I report an absence?', 'Hi, my zoom does not work'])
+def test_questions_go_on_to_retrieval(gate, question):
+    assert gate.check_question(question) is None
+
+
+def test_questions_without_relevant_passages_get_the_service_desk(gate):
+    assert gate.check_passages([passage(0.5), passage(0.7)]) == ConfidenceGate.OUT_OF_SCOPE_REPLY
+    assert gate.check_passages([]) == ConfidenceGate.OUT_OF_SCOPE_REPLY
+
+
+def test_one_relevant_passage_is_enough(gate):
+    assert gate.check_passages([passage(0.5), passage(0.9)]) is None
+
+
+def test_keyword_hits_without_certainty_pass(gate):
+    assert gate.check_passages([passage(), {'article_id': '2'}]) is None
+
+
+def test_stats_count_the_decisions(gate):
+    gate.check_question('hello')
+    gate.check_passages([passage(0.1)])
+    gate.check_passages([passage(0.9)])
+    gate.check_passages([passage(0.95)])
+
+    assert gate.stats() == {'passed': 2, 'small_talk': 1, 'low_confidence': 1, 'gated_ratio': 0.5}
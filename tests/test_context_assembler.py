@@ -0,0 +1,53 @@
+from context_assembler import ARTICLE_URL, ContextAssembler, count_tokens
+
+
+def passage(article_id: str, text: str) -> dict:
+    return {'article_id': article_id, 'text': text}
+
+
+def test_passages_of_an_article_are_merged_and_the_best_article_comes_last():
+    text, article_ids = ContextAssembler(budget_tokens=1000).assemble([
+        passage('1', 'Open the settings.'),
+        passage('2', 'Restart the laptop.'),
+        passage('1', 'Click on reset.'),
+    ])
+
+    assert article_ids == ['1', '2']
+    assert text.count(ARTICLE_URL) == 2
+    assert text.index(f'{ARTICLE_URL}2') < text.index(f'{ARTICLE_URL}1')
+    assert 'Open the settings.\nClick on reset.' in text
+
+
+def test_sentences_repeated_by_overlapping_passages_are_dropped():
+    text, _ = ContextAssembler(budget_tokens=1000).assemble([
+        passage('1', 'Open the settings. Click on reset.'),
+        passage('1', 'click on   reset. Confirm with OK.'),
+    ])
+
+    assert text.count('reset') == 1
+    assert 'Confirm with OK.' in text
+
+
+def test_the_text_stays_within_the_budget_and_is_cut_at_a_sentence():
+    sentences = ' '.join(f'This is sentence number {idx}.' for idx in range(100))
+    assembler = ContextAssembler(budget_tokens=100)
+
+    text, article_ids = assembler.assemble([passage('1', sentences), passage('2', 'Never included.')])
+
+    assert article_ids == ['1']
+    assert count_tokens(text) <= assembler.budget_tokens
+    assert text.split('```')[1].rstrip().endswith('.')
+
+
+def test_articles_without_room_for_their_document_are_skipped():
+    assembler = ContextAssembler(budget_tokens=40)
+
+    _, article_ids = assembler.assemble([passage('1', 'Short.'), passage('2', 'Also short.')])
+
+    assert article_ids == ['1']
+
+
+def test_backticks_cannot_close_the_fence_of_a_document():
+    text, _ = ContextAssembler(budget_tokens=1000).assemble([passage('1', 'Run ```rm -rf``` now.')])
+
+    assert text.count('```') == 2
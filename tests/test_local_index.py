@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from local_index import LocalVectorIndex
+
+
+def passage(article_id: str) -> dict:
+    return {'article_id': article_id, 'title': f'Page {article_id}', 'text': f'Passage of {article_id}'}
+
+
+@pytest.fixture
+def location(tmp_path):
+    return str(tmp_path / 'local_index')
+
+
+def test_an_index_without_files_is_not_ready(location):
+    assert not LocalVectorIndex(location).ready
+
+
+def test_search_returns_the_closest_passages_first(location):
+    index = LocalVectorIndex(location)
+    index.build([passage('x'), passage('y'), passage('xy')], [[1, 0], [0, 1], [1, 1]])
+
+    results = index.search_many([[1, 0.1], [0, 2]], k=2)
+
+    assert [[hit['article_id'] for hit in hits] for hits in results] == [['x', 'xy'], ['y', 'xy']]
+    assert results[1][0]['_additional']['distance'] == pytest.approx(0)
+    assert results[1][0]['_additional']['certainty'] == pytest.approx(1)
+
+
+def test_k_is_capped_at_the_number_of_passages(location):
+    index = LocalVectorIndex(location)
+    index.build([passage('x')], [[1, 0]])
+
+    hits = index.search([0, 1], k=5)['data']['Get']['Passage']
+
+    assert [hit['article_id'] for hit in hits] == ['x']
+    assert hits[0]['_additional']['distance'] == pytest.approx(1)
+
+
+def test_a_build_of_another_process_is_picked_up(location):
+    reader = LocalVectorIndex(location)
+    assert not reader.ready
+
+    LocalVectorIndex(location).build([passage('x')], [[1, 0]])
+    assert reader.ready
+
+    LocalVectorIndex(location).build([passage('y')], [[0, 1]])
+    assert reader.search([0, 1], k=1)['data']['Get']['Passage'][0]['article_id'] == 'y'
+
+
+def test_files_that_do_not_match_are_ignored(location):
+    LocalVectorIndex(location).build([passage('x')], [[1, 0]])
+    with open(f'{location}_passages.json', 'w') as file:
+        json.dump([passage('x'), passage('y')], file)
+
+    assert not LocalVectorIndex(location).ready
@@ -0,0 +1,60 @@
+import pytest
+
+import model_router
+from model_router import ModelRouter
+
+SIMPLE = 'How do I report an absence?'
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(fast_deployment='gpt35', strong_deployment='gpt4')
+
+
+def test_simple_questions_with_a_confident_match_go_to_the_fast_deployment(router):
+    assert router.route(SIMPLE, certainty=0.95) == ['gpt35', 'gpt4']
+
+
+def test_questions_without_a_confident_match_go_to_the_strong_deployment(router):
+    assert router.route(SIMPLE, certainty=0.5) == ['gpt4', 'gpt35']
+    assert router.route(SIMPLE) == ['gpt4', 'gpt35']
+
+
+@pytest.mark.parametrize('question', [
+    'Why was my absence rejected?',
+    'How do I report an absence? And who approves it?',
+    ' '.join(['word'] * 30),
+])
+def test_complex_questions_go_to_the_strong_deployment(router, question):
+    assert router.route(question, certainty=0.95) == ['gpt4', 'gpt35']
+
+
+def test_a_single_deployment_is_always_used():
+    assert ModelRouter(fast_deployment='gpt4', strong_deployment='gpt4').route(SIMPLE, 0.95) == ['gpt4']
+
+
+def test_a_throttled_deployment_is_tried_last(router):
+    router.record_failure('gpt35', throttled=True)
+
+    assert router.route(SIMPLE, certainty=0.95) == ['gpt4', 'gpt35']
+    assert router.stats()['gpt35']['throttled']
+
+
+def test_a_slow_deployment_is_tried_last_until_it_recovers(router, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_router.time, 'monotonic', lambda: now[0])
+    router.record_success('gpt35', ModelRouter.SLOW_SECONDS + 5)
+
+    assert router.route(SIMPLE, certainty=0.95) == ['gpt4', 'gpt35']
+
+    now[0] += ModelRouter.RECOVERY_SECONDS + 1
+    assert router.route(SIMPLE, certainty=0.95) == ['gpt35', 'gpt4']
+
+
+def test_a_failing_deployment_is_kept_first_when_the_other_one_fails_too(router):
+    for _ in range(5):
+        router.record_failure('gpt4')
+        router.record_failure('gpt35')
+
+    assert router.route(SIMPLE, certainty=0.5) == ['gpt4', 'gpt35']
+    assert router.stats()['gpt4']['error_rate'] > ModelRouter.MAX_ERROR_RATE
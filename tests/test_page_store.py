@@ -0,0 +1,99 @@
+import pytest
+
+from page_store import PageStore
+
+
+def page(article_id: str, version: int = 1, **fields) -> dict:
+    return {
+        'article_id': article_id, 'title': f'Page {article_id}', 'version': version,
+        'last_edited': '2023-10-01T10:00:00.000Z', 'language': 'en', 'words': 2, 'text': 'some text', **fields,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PageStore(str(tmp_path / 'pages.db'))
+
+
+def test_replace_fills_an_empty_store(store):
+    assert store.pages() is None
+
+    counts = store.replace([page('1'), page('2')])
+
+    assert counts == {'written': 2, 'deleted': 0}
+    assert store.pages() == [page('1'), page('2')]
+    assert store.versions() == {'1': 1, '2': 1}
+    assert store.synced_at() is not None
+
+
+def test_replace_writes_changed_pages_and_deletes_missing_ones(store):
+    store.replace([page('1'), page('2'), page('3')])
+
+    counts = store.replace([page('1'), page('2', version=2, text='new text'), page('4')])
+
+    assert counts == {'written': 2, 'deleted': 1}
+    assert store.versions() == {'1': 1, '2': 2, '4': 1}
+    assert store.get('2')['text'] == 'new text'
+    assert store.get('3') is None
+
+
+def test_replace_with_the_same_pages_changes_nothing(store):
+    store.replace([page('1'), page('2')])
+    updated_at = store.updated_at()
+
+    counts = store.replace([page('1'), page('2')])
+
+    assert counts == {'written': 0, 'deleted': 0}
+    assert store.updated_at() == updated_at
+
+
+def test_pages_of_another_renderer_revision_are_not_stored(tmp_path):
+    location = str(tmp_path / 'pages.db')
+    PageStore(location, revision=1).replace([page('1')])
+
+    store = PageStore(location, revision=2)
+
+    assert store.versions() == {}
+    assert store.replace([page('1')]) == {'written': 1, 'deleted': 0}
+
+
+def test_pages_without_language_have_no_language_key(store):
+    store.replace([page('1', language=None)])
+
+    assert 'language' not in store.get('1')
+
+
+def test_iter_pages_without_text(store):
+    store.replace([page('1')])
+
+    assert 'text' not in next(store.iter_pages(with_text=False))
+
+
+def test_changes_are_read_back_since_a_generation(store):
+    assert store.changes_since(None) == (0, [])
+
+    first = store.publish_changes(['1', '2'])
+    second = store.publish_changes(['3'])
+
+    assert store.publish_changes([]) == second
+    assert store.changes_since(first) == (second, ['3'])
+    assert sorted(store.changes_since(0)[1]) == ['1', '2', '3']
+    assert store.changes_since(second) == (second, [])
+
+
+def test_changes_beyond_the_kept_log_are_unknown(store, monkeypatch):
+    monkeypatch.setattr(PageStore, 'CHANGES_KEPT', 2)
+    for _ in range(4):
+        store.publish_changes(['1'])
+
+    assert store.changes_since(1) == (4, None)
+    assert store.changes_since(2) == (4, ['1'])
+
+
+def test_a_change_of_everything_is_published_without_ids(store):
+    first = store.publish_changes(['1'])
+    second = store.publish_changes([], everything=True)
+    third = store.publish_changes(['2'])
+
+    assert store.changes_since(first) == (third, None)
+    assert store.changes_since(second) == (third, ['2'])
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_the_result_of_the_first():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 'answer'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', compute)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do('key', compute))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flight.counters['coalesced'] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert results == ['answer'] * 4
+    assert len(calls) == 1
+    assert flight.counters == {'executed': 1, 'coalesced': 3}
+
+
+def test_sequential_calls_are_executed_again():
+    flight = SingleFlight()
+
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+    assert flight.counters == {'executed': 2, 'coalesced': 0}
+
+
+def test_the_error_of_the_call_is_raised_and_the_key_released():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_a_follower_joining_mid_stream_gets_every_item():
+    flight = SingleFlight()
+    leader = flight.stream('key', lambda: iter(['a', 'b', 'c']))
+    assert next(leader) == 'a'
+
+    follower = flight.stream('key', lambda: iter(['never']))
+    assert next(follower) == 'a'
+
+    assert list(leader) == ['b', 'c']
+    assert list(follower) == ['b', 'c']
+    assert flight.counters == {'executed': 1, 'coalesced': 1}
+
+
+def test_followers_get_the_rest_when_the_leader_stops_reading():
+    flight = SingleFlight()
+    leader = flight.stream('key', lambda: iter(['a', 'b', 'c']))
+    next(leader)
+    follower = flight.stream('key', lambda: iter(['never']))
+    next(follower)
+
+    leader.close()
+
+    assert list(follower) == ['b', 'c']
+    assert list(flight.stream('key', lambda: iter(['new']))) == ['new']
+
+
+def test_the_error_of_the_stream_reaches_the_followers():
+    flight = SingleFlight()
+
+    def items():
+        yield 'a'
+        raise ValueError('boom')
+
+    leader = flight.stream('key', items)
+    next(leader)
+    follower = flight.stream('key', lambda: iter(['never']))
+    assert next(follower) == 'a'
+
+    with pytest.raises(ValueError):
+        list(leader)
+    with pytest.raises(ValueError):
+        list(follower)
@@ -0,0 +1,179 @@
+import uuid
+
+import pytest
+
+from articles_operator import ArticlesOperator
+from weaviate_facade import WeaviateFacade
+
+
+class InMemoryFacade:
+    """Stands in for WeaviateFacade: keeps the objects per class, keyed by uuid"""
+
+    def __init__(self):
+        self.objects = {'Article': {}, 'Passage': {}}
+        self.uploaded = {'Article': [], 'Passage': []}
+
+    def ensure_class(self, record_class) -> None:
+        pass
+
+    def iter_objects(self, class_name: str, properties: list, page_size: int = 100):
+        objects = [
+            {**{key: obj.get(key) for key in properties}, '_additional': {'id': object_id}}
+            for object_id, obj in sorted(self.objects[class_name].items())
+        ]
+        for start in range(0, len(objects), page_size):
+            yield objects[start:start + page_size]
+
+    def upload_data(self, data, data_type, vectors: list = None) -> dict:
+        for record in data:
+            class_name, obj = WeaviateFacade.mapper(data_type, record)
+            self.objects[class_name][WeaviateFacade.object_uuid(data_type, obj)] = obj
+            self.uploaded[class_name].append(obj)
+        return {'imported': len(data), 'failed': []}
+
+    def delete_objects(self, uuids, class_name: str) -> None:
+        for object_id in uuids:
+            self.objects[class_name].pop(object_id, None)
+
+    def delete_where(self, class_name: str, path: str, values) -> None:
+        values = set(values)
+        self.objects[class_name] = {
+            object_id: obj for object_id, obj in self.objects[class_name].items() if obj[path] not in values
+        }
+
+    def article_ids(self, class_name: str = 'Article') -> list:
+        return sorted({obj['article_id'] for obj in self.objects[class_name].values()})
+
+
+def page(article_id: str, text: str = None) -> dict:
+    return {
+        'article_id': article_id, 'title': f'Page {article_id}', 'version': 1,
+        'last_edited': '2023-10-01T10:00:00.000Z', 'language': 'en',
+        'text': text if text is not None else f'How to handle case {article_id}',
+    }
+
+
+@pytest.fixture
+def facade():
+    return InMemoryFacade()
+
+
+@pytest.fixture
+def operator(tmp_path, monkeypatch, facade):
+    # The page store and the caches of the operator are files in the working directory
+    monkeypatch.chdir(tmp_path)
+    operator = ArticlesOperator(client=facade)
+    # No embeddings deployment: Weaviate would vectorize the records itself
+    monkeypatch.setattr(operator, '_embed_records', lambda records: None)
+    return operator
+
+
+def sync(operator, pages: list, limit=None) -> dict:
+    operator.pages = [dict(item) for item in pages]
+    return operator.upload(limit)
+
+
+def test_first_sync_uploads_every_page(operator, facade):
+    summary = sync(operator, [page('1'), page('2')])
+
+    assert summary == {'new': ['1', '2'], 'changed': [], 'deleted': [], 'unchanged': []}
+    assert facade.article_ids() == ['1', '2']
+    assert facade.article_ids('Passage') == ['1', '2']
+
+
+def test_objects_are_stored_under_the_uuid_of_their_article(operator, facade):
+    sync(operator, [page('1')])
+
+    assert list(facade.objects['Article']) == [WeaviateFacade.object_uuid('Article', {'article_id': '1'})]
+
+
+def test_second_sync_tells_new_changed_deleted_and_unchanged_apart(operator, facade):
+    sync(operator, [page('1'), page('2'), page('3')])
+    facade.uploaded = {'Article': [], 'Passage': []}
+
+    summary = sync(operator, [page('1'), page('2', text='Updated text'), page('4')])
+
+    assert summary == {'new': ['4'], 'changed': ['2'], 'deleted': ['3'], 'unchanged': ['1']}
+    assert sorted(obj['article_id'] for obj in facade.uploaded['Article']) == ['2', '4']
+    assert facade.article_ids() == ['1', '2', '4']
+    assert facade.article_ids('Passage') == ['1', '2', '4']
+    assert [obj['text'] for obj in facade.objects['Passage'].values() if obj['article_id'] == '2'] == ['Updated text']
+
+
+def test_unchanged_pages_are_not_uploaded_again(operator, facade):
+    sync(operator, [page('1'), page('2')])
+    facade.uploaded = {'Article': [], 'Passage': []}
+
+    summary = sync(operator, [page('1'), page('2')])
+
+    assert summary['unchanged'] == ['1', '2']
+    assert facade.uploaded == {'Article': [], 'Passage': []}
+
+
+def test_pages_without_text_are_skipped(operator, facade):
+    summary = sync(operator, [page('1'), page('2', text='')])
+
+    assert summary['new'] == ['1']
+    assert facade.article_ids() == ['1']
+
+
+def test_objects_under_legacy_uuids_are_replaced(operator, facade):
+    legacy_uuid = str(uuid.uuid4())
+    _, legacy = WeaviateFacade.mapper('Article', {**page('1'), 'content_hash': ''})
+    facade.objects['Article'][legacy_uuid] = legacy
+
+    summary = sync(operator, [page('1')])
+
+    assert summary['changed'] == ['1']
+    assert legacy_uuid not in facade.objects['Article']
+    assert list(facade.objects['Article']) == [WeaviateFacade.object_uuid('Article', {'article_id': '1'})]
+
+
+def test_unchanged_content_under_a_legacy_uuid_is_moved_to_the_article_uuid(operator, facade):
+    sync(operator, [page('1')])
+    (article_uuid, article), = facade.objects['Article'].items()
+    legacy_uuid = str(uuid.uuid4())
+    facade.objects['Article'] = {legacy_uuid: article}
+
+    summary = sync(operator, [page('1')])
+
+    assert summary['changed'] == ['1']
+    assert list(facade.objects['Article']) == [article_uuid]
+
+
+def test_limit_keeps_the_old_objects_of_pages_that_were_not_uploaded(operator, facade):
+    legacy_uuid = str(uuid.uuid4())
+    _, legacy = WeaviateFacade.mapper('Article', {**page('2', text='Old text'), 'content_hash': 'outdated'})
+    facade.objects['Article'][legacy_uuid] = legacy
+
+    summary = sync(operator, [page('1'), page('2')], limit=1)
+
+    assert summary['new'] == ['1'] and summary['changed'] == ['2']
+    assert facade.objects['Article'][legacy_uuid] == legacy
+    assert facade.article_ids() == ['1', '2']
+
+
+def test_deleted_articles_lose_their_passages(operator, facade):
+    sync(operator, [page('1'), page('2')])
+
+    sync(operator, [page('1')])
+
+    assert facade.article_ids('Passage') == ['1']
+
+
+def test_changed_and_deleted_articles_are_published_for_the_answer_caches(operator):
+    sync(operator, [page('1'), page('2'), page('3')])
+    generation, _ = operator.store.changes_since(None)
+
+    sync(operator, [page('1'), page('2', text='Updated text')])
+
+    assert sorted(operator.store.changes_since(generation)[1]) == ['2', '3']
+
+
+def test_new_articles_clear_the_answer_caches(operator):
+    sync(operator, [page('1')])
+    ArticlesOperator.answer_cache.put('How do I reset my password?', 'No article covers this', [])
+
+    sync(operator, [page('1'), page('2')])
+
+    assert ArticlesOperator.answer_cache.get('How do I reset my password?') is None
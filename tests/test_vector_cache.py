@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from embeddings import VectorCache
+
+
+@pytest.fixture
+def location(tmp_path):
+    return str(tmp_path / 'vector_cache.bin')
+
+
+def test_vectors_are_read_back_after_a_restart(location):
+    first, second = VectorCache.key('model', 'first'), VectorCache.key('model', 'second')
+    cache = VectorCache(location)
+    cache.put_many([(first, [1.0, 2.0, 3.0])])
+    cache.put_many([(second, [4.0, 5.0, 6.0])])
+
+    reloaded = VectorCache(location)
+
+    assert len(reloaded) == 2 and reloaded.dim == 3
+    np.testing.assert_array_equal(reloaded.get(first), [1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(reloaded.get(second), [4.0, 5.0, 6.0])
+
+
+def test_keys_ending_with_nul_bytes_are_found(location):
+    key = b"\x01" * 18 + b"\0\0"
+    VectorCache(location).put_many([(key, [1.0, 2.0])])
+
+    assert VectorCache(location).get(key) is not None
+    cache = VectorCache(location)
+    cache.put_many([(key, [3.0, 4.0])])
+    np.testing.assert_array_equal(cache.get(key), [3.0, 4.0])
+
+
+def test_a_record_cut_short_is_dropped(location):
+    keys = [VectorCache.key('model', text) for text in ('first', 'second')]
+    VectorCache(location).put_many([(key, [1.0, 2.0]) for key in keys])
+    with open(location, 'r+b') as file:
+        file.truncate(file.seek(0, 2) - 3)
+
+    cache = VectorCache(location)
+
+    assert len(cache) == 1 and cache.get(keys[0]) is not None
+
+
+def test_keys_depend_on_the_model():
+    assert VectorCache.key('small', 'text') != VectorCache.key('large', 'text')
@@ -1,22 +1,28 @@
 import os
-from typing import Tuple
+import queue
+import threading
+from typing import Iterator, List, Tuple
 
 from weaviate import AuthApiKey, Client
 from weaviate.util import generate_uuid5
-from schema import article_class
+from batch_importer import BatchImporter
+from schema import article_class, passage_class
 import requests
 
 class WeaviateFacade:
     """Facade for the Weaviate client
-    todo: make a singleton
+    Use WeaviateFacade.instance() to share one client within the process
     """
+    _instance = None
+    _instance_lock = threading.Lock()
+
     def __init__(self, recreate_schema: bool = False):
         self._client = self._create_client()
         self.query = self._client.query
+        self._batch_clients = queue.SimpleQueue()
 
         if recreate_schema:
-            self.purge_schema()
-            self.create_class(article_class)
+            self.recreate_schema()
 
         self.base_url = os.getenv('AZURE_OPENAI_BASE')
         self.api_key = os.getenv('AZURE_OPENAI_KEY')
@@ -25,6 +31,22 @@ class WeaviateFacade:
             "api-key": self.api_key
         }
 
+    @classmethod
+    def instance(cls, recreate_schema: bool = False) -> 'WeaviateFacade':
+        """The facade shared by the whole process, created on first use"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(recreate_schema)
+                return cls._instance
+
+        if recreate_schema:
+            cls._instance.recreate_schema()
+        return cls._instance
+
+    def is_ready(self) -> bool:
+        """Readiness check of the Weaviate instance"""
+        return self._client.is_ready()
+
     @staticmethod
     def _create_client() -> Client:
         """Create the Weaviate client instance"""
@@ -49,30 +71,130 @@ class WeaviateFacade:
         self._client.schema.delete_all()
         print("Deleted the current schema with all objects")
 
+    def recreate_schema(self) -> None:
+        """Wipe out the schema and create the classes of the app again"""
+        self.purge_schema()
+        self.create_class(article_class)
+        self.create_class(passage_class)
+
     def create_class(self, record_class) -> None:
         """Recreate the given class in the schema"""
         self._client.schema.create_class(record_class)
         print(f'Class {record_class} was successfully re-created')
 
-    def upload_data(self, data, data_type) -> None:
+    def ensure_class(self, record_class) -> None:
+        """Create the class if it is missing and add properties that were introduced later"""
+        class_name = record_class["class"]
+        if not self._client.schema.exists(class_name):
+            self.create_class(record_class)
+            return
+
+        existing = {prop["name"] for prop in self._client.schema.get(class_name).get("properties", [])}
+        for prop in record_class["properties"]:
+            if prop["name"] not in existing:
+                self._client.schema.property.create(class_name, prop)
+                print(f'Property {prop["name"]} was added to class {class_name}')
+
+    def upload_data(self, data, data_type, vectors: list = None) -> dict:
         """
         Upload the data to the db
-        For each record, reproducible uuid is generated so the same entries won't be added again
+        For each record, reproducible uuid is generated from its identity,
+        so a changed record replaces its previous version instead of being added next to it.
+        Records uploaded with their vector are not vectorized by Weaviate again
+        """
+        objects = []
+        for idx, record in enumerate(data):
+            class_name, class_object = self.mapper(data_type, record)
+            obj = {
+                "class": class_name,
+                "properties": class_object,
+                "id": self.object_uuid(data_type, class_object),
+            }
+            if vectors is not None:
+                obj["vector"] = vectors[idx]
+            objects.append(obj)
+
+        summary = BatchImporter(self._send_batch).import_objects(objects)
+        if summary['failed']:
+            print(f"Failed to upload {len(summary['failed'])} {data_type} records: {summary['failed'][:5]}")
+
+        print(f"Total of {summary['imported']} records were uploaded")
+        return summary
+
+    def _send_batch(self, objects: list) -> list:
+        """Post one batch of objects, returning the error message of every object (None when it was imported)"""
+        client = self._borrow_batch_client()
+        try:
+            for obj in objects:
+                client.batch.add_data_object(obj["properties"], obj["class"], obj["id"], obj.get("vector"))
+            results = client.batch.create_objects()
+        finally:
+            client.batch.empty_objects()
+            self._batch_clients.put(client)
+
+        errors = []
+        for result in results:
+            error = result.get("result", {}).get("errors")
+            errors.append("; ".join(item.get("message", "") for item in error.get("error", [])) if error else None)
+        return errors
+
+    def _borrow_batch_client(self) -> Client:
         """
-        with self._client.batch(
-                batch_size=200,
-                num_workers=2
-        ) as batch:
-            for idx, record in enumerate(data):
-                class_name, class_object = self.mapper(data_type, record)
-                batch.add_data_object(
-                    class_object,
-                    class_name,
-                    uuid=generate_uuid5(class_object)
-                )
-                print(f'imported {type} {idx + 1}')
-
-        print(f'Total of {len(data)} records were uploaded')
+        A client for one manual batch. A client collects a single batch at a time,
+        so every concurrent batch of the BatchImporter gets its own; they are reused by later imports
+        """
+        try:
+            return self._batch_clients.get_nowait()
+        except queue.Empty:
+            pass
+
+        client = self._create_client()
+        # Failed objects are retried by the BatchImporter
+        client.batch.configure(batch_size=None, dynamic=False, callback=None, timeout_retries=0, connection_error_retries=0)
+        return client
+
+    def delete_objects(self, uuids, class_name: str) -> None:
+        """Delete the objects with the given uuids"""
+        for uuid in uuids:
+            self._client.data_object.delete(uuid, class_name)
+
+        print(f'Total of {len(uuids)} {class_name} objects were deleted')
+
+    def delete_where(self, class_name: str, path: str, values) -> None:
+        """Delete all the objects of the class whose `path` property equals one of the values"""
+        for value in values:
+            self._client.batch.delete_objects(
+                class_name,
+                where={
+                    "path": [path],
+                    "operator": "Equal",
+                    "valueText": value
+                }
+            )
+
+    def iter_objects(self, class_name: str, properties: List[str], page_size: int = 100) -> Iterator[list]:
+        """
+        Scan the whole class with a cursor on the object uuid, yielding one batch of objects at a time.
+        Every object carries its uuid in ['_additional']['id']
+        """
+        cursor = None
+        while True:
+            query = self._client.query.get(class_name, properties) \
+                .with_additional(["id"]) \
+                .with_limit(page_size)
+            if cursor is not None:
+                query = query.with_after(cursor)
+
+            response = query.do()
+            if 'errors' in response:
+                raise Exception(f"Failed to scan {class_name}: {response['errors']}")
+
+            batch = response['data']['Get'][class_name]
+            if not batch:
+                return
+
+            yield batch
+            cursor = batch[-1]['_additional']['id']
 
     def search_articles(self, query: str, limit=5) -> dict:
         return self._client.query.get("Article", ["title", "text", "article_id"]) \
@@ -80,6 +202,19 @@ class WeaviateFacade:
             .with_limit(limit) \
             .do()
 
+    def search_passages(self, query: str, limit=5, vector=None) -> dict:
+        """
+        Passages nearest to the query, with their distance and certainty.
+        With the query vector at hand Weaviate does not embed it again
+        """
+        search = self._client.query.get("Passage", ["title", "text", "article_id", "position"]) \
+            .with_additional(["distance", "certainty"])
+        if vector is not None:
+            search = search.with_near_vector({"vector": vector})
+        else:
+            search = search.with_near_text({"concepts": query})
+        return search.with_limit(limit).do()
+
     def search_messages(self, chat_identifier, query: str, limit=5, min_words: int = 50) -> dict:
         with_where = None
         if type(chat_identifier) == int:
@@ -101,11 +236,24 @@ class WeaviateFacade:
             .with_limit(limit) \
             .do()
 
+    @staticmethod
+    def object_uuid(data_type, class_object) -> str:
+        """Deterministic uuid of an object, derived from its identity key when the class has one"""
+        id_key = {
+            'Article': 'article_id',
+            'Passage': 'chunk_id',
+        }.get(data_type)
+
+        if id_key is None:
+            return generate_uuid5(class_object)
+        return generate_uuid5(class_object[id_key], data_type)
+
     @staticmethod
     def mapper(data_type, record) -> Tuple[str, dict]:
         """Mappings for uploading the data"""
         record_class = {
             'Article': article_class,
+            'Passage': passage_class,
         }[data_type]
 
         class_name = record_class["class"]